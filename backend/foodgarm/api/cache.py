@@ -0,0 +1,225 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+RECIPE_LIST_PREFIX = 'recipes:list'
+RECIPE_LIST_VERSION_KEY = f'{RECIPE_LIST_PREFIX}:version'
+RECIPE_LIST_HITS_KEY = f'{RECIPE_LIST_PREFIX}:hits'
+RECIPE_LIST_MISSES_KEY = f'{RECIPE_LIST_PREFIX}:misses'
+TAGS_VERSION_KEY = 'tags:version'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+RECIPE_INGREDIENTS_VERSION_KEY = 'recipes:ingredients:version'
+
+
+def user_version_key(user_id):
+    """Namespace of per-user state: favorites, shopping cart, follows."""
+    return f'users:{user_id}:version'
+
+
+def get_namespace_version(version_key):
+    """Current version of a cache namespace.
+
+    A missing version starts from the current time, so an evicted counter
+    never brings back entries written under an older version.
+    """
+    version = cache.get(version_key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+    return version
+
+
+def bump_namespace_version(version_key):
+    """Invalidate every entry of a namespace without scanning keys.
+
+    Returns the new version.
+    """
+    try:
+        version = cache.incr(version_key)
+    except ValueError:
+        version = get_namespace_version(version_key)
+    cache.set(f'{version_key}:modified', int(time.time()), None)
+    return version
+
+
+def log_namespace_change(version_key, change):
+    """Bump a namespace version and record what changed under it.
+
+    Process-local snapshots that are a few versions behind replay these
+    records instead of rebuilding from scratch.
+    """
+    version = bump_namespace_version(version_key)
+    cache.set(
+        f'{version_key}:changes:{version}',
+        change,
+        settings.CHANGE_JOURNAL_TIMEOUT
+    )
+
+
+def get_namespace_changes(version_key, since, until, limit):
+    """Changes recorded after version since up to version until.
+
+    Returns None when any of them is missing: evicted, expired or not
+    written yet. More than limit versions, or a version that went back,
+    also give None without reading anything: a version lost with the
+    cache restarts from the clock, millions of versions away.
+    """
+    if until < since or until - since > limit:
+        return None
+    keys = [
+        f'{version_key}:changes:{version}'
+        for version in range(since + 1, until + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+    return [changes[key] for key in keys]
+
+
+def get_namespace_state(version_keys):
+    """Versions of several namespaces and the time of their last change.
+
+    Everything is read with a single cache round trip; a namespace that
+    was never changed counts as modified now.
+    """
+    modified_keys = [f'{key}:modified' for key in version_keys]
+    state = cache.get_many([*version_keys, *modified_keys])
+    now = int(time.time())
+    for key in modified_keys:
+        if key not in state:
+            cache.add(key, now, None)
+    versions = tuple(
+        state.get(key) or get_namespace_version(key) for key in version_keys
+    )
+    last_modified = max(state.get(key, now) for key in modified_keys)
+    return versions, last_modified
+
+
+def increment_counter(key):
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def recipe_list_cache_key(request):
+    """Key of an anonymous recipe list built from normalised parameters."""
+    params = request.query_params
+    normalised = [
+        ('page', params.get('page') or '1'),
+        ('limit', params.get('limit') or str(
+            settings.REST_FRAMEWORK['PAGE_SIZE'])),
+        ('author', params.get('author', '')),
+        ('tags', ','.join(sorted(set(params.getlist('tags'))))),
+        ('pagination', params.get('pagination', '')),
+        ('cursor', params.get('cursor', '')),
+        ('search', params.get('search', '').strip()),
+        ('host', request.get_host()),
+        ('path', request.path),
+    ]
+    digest = hashlib.md5(repr(normalised).encode()).hexdigest()
+    version = get_namespace_version(RECIPE_LIST_VERSION_KEY)
+    return f'{RECIPE_LIST_PREFIX}:{version}:{digest}'
+
+
+def get_recipe_list(request):
+    key = recipe_list_cache_key(request)
+    data = cache.get(key)
+    if data is None:
+        increment_counter(RECIPE_LIST_MISSES_KEY)
+    else:
+        increment_counter(RECIPE_LIST_HITS_KEY)
+    return key, data
+
+
+def set_recipe_list(key, data):
+    cache.set(key, data, settings.RECIPE_LIST_CACHE_TIMEOUT)
+
+
+def invalidate_recipe_lists():
+    bump_namespace_version(RECIPE_LIST_VERSION_KEY)
+
+
+def get_recipe_list_stats():
+    return {
+        'hits': cache.get(RECIPE_LIST_HITS_KEY, 0),
+        'misses': cache.get(RECIPE_LIST_MISSES_KEY, 0),
+    }
+
+
+def reset_recipe_list_stats():
+    cache.delete_many((RECIPE_LIST_HITS_KEY, RECIPE_LIST_MISSES_KEY))
+
+
+RECIPE_FRAGMENT_PREFIX = 'recipes:fragment'
+RECIPE_FRAGMENT_VERSION_KEY = f'{RECIPE_FRAGMENT_PREFIX}:version'
+
+
+def recipe_fragment_version_key(recipe_id):
+    return f'{RECIPE_FRAGMENT_PREFIX}:{recipe_id}:version'
+
+
+def recipe_fragment_keys(recipe_ids):
+    """Fragment keys by recipe id.
+
+    A key carries the global fragment version and the version of the
+    recipe itself, read with one round trip.
+    """
+    version = get_namespace_version(RECIPE_FRAGMENT_VERSION_KEY)
+    version_keys = {
+        recipe_id: recipe_fragment_version_key(recipe_id)
+        for recipe_id in recipe_ids
+    }
+    versions = cache.get_many(version_keys.values())
+    return {
+        recipe_id: '{}:{}:{}:{}'.format(
+            RECIPE_FRAGMENT_PREFIX,
+            version,
+            recipe_id,
+            versions.get(key) or get_namespace_version(key)
+        )
+        for recipe_id, key in version_keys.items()
+    }
+
+
+def get_recipe_fragments(recipe_ids):
+    """Keys and shared, user-independent parts of serialized recipes.
+
+    Missing fragments must be stored under the returned keys: they were
+    read before the recipes, so a fragment built from data that changed
+    meanwhile lands under a version that is no longer read.
+    """
+    keys = recipe_fragment_keys(recipe_ids)
+    fragments = cache.get_many(keys.values())
+    return keys, {
+        recipe_id: fragments[key]
+        for recipe_id, key in keys.items()
+        if key in fragments
+    }
+
+
+def set_recipe_fragments(keys, fragments):
+    cache.set_many(
+        {
+            keys[recipe_id]: fragment
+            for recipe_id, fragment in fragments.items()
+        },
+        settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+    )
+
+
+def invalidate_recipe_fragments(recipe_ids=None):
+    """Move the given recipes, or all of them, to a new fragment version."""
+    if recipe_ids is None:
+        bump_namespace_version(RECIPE_FRAGMENT_VERSION_KEY)
+        return
+    for recipe_id in set(recipe_ids):
+        key = recipe_fragment_version_key(recipe_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            get_namespace_version(key)
@@ -1,6 +1,13 @@
+from django.db.models import F
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Tag, Ingredient
+from recipes.models import (
+    TAGS_MASK_BITS,
+    Ingredient,
+    Recipe,
+    Tag,
+    get_tags_mask
+)
 from users.models import User
 
 
@@ -12,25 +19,49 @@ class RecipeFilter(filters.FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',)
+        fields = (
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+        )
         model = Recipe
 
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        if any(tag.id > TAGS_MASK_BITS for tag in value):
+            return queryset.filter(tags__in=value).distinct()
+        return queryset.alias(
+            tags_match=F('tags_mask').bitand(
+                get_tags_mask(tag.id for tag in value)
+            )
+        ).filter(tags_match__gt=0)
+
     def get_is_favorited(self, queryset, name, value):
         if not value or self.request.user.is_anonymous:
             return queryset
-        return queryset.filter(favorite_recipe__user=self.request.user)
+        return queryset.filter(is_favorited=True)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if not value or self.request.user.is_anonymous:
             return queryset
-        return queryset.filter(shopping_carts__user=self.request.user)
+        return queryset.filter(is_in_shopping_cart=True)
+
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return queryset.search(value)
 
 
 class IngredientFilter(filters.FilterSet):
@@ -0,0 +1,301 @@
+import bisect
+import gzip
+import hashlib
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, IngredientRecipe
+from .cache import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPE_INGREDIENTS_VERSION_KEY,
+    get_namespace_changes,
+    get_namespace_version
+)
+from .serializers import IngredientSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class VersionedSnapshot:
+    """Process-local data rebuilt when a cache namespace version changes.
+
+    With stamp_model set, the row count and the largest id of that table
+    are part of the version too. They are read at most every
+    SNAPSHOT_STAMP_TTL seconds and catch writes that bypass signals or a
+    cache that is not shared between processes.
+    """
+
+    version_key = None
+    stamp_model = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.stamp = (0, None)
+
+    def build(self):
+        raise NotImplementedError
+
+    def update(self, old_version, version):
+        """Bring the snapshot from old_version to version in place.
+
+        Returns False when only a full build will do.
+        """
+        return False
+
+    def get_stamp(self):
+        if self.stamp_model is None:
+            return None
+        checked, stamp = self.stamp
+        now = time.monotonic()
+        if stamp is None or now - checked >= settings.SNAPSHOT_STAMP_TTL:
+            stamp = tuple(self.stamp_model.objects.aggregate(
+                count=Count('id'), last=Max('id')
+            ).values())
+            self.stamp = (now, stamp)
+        return stamp
+
+    def ensure_fresh(self):
+        version = (get_namespace_version(self.version_key), self.get_stamp())
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    if self.version is None or not self.update(
+                        self.version, version
+                    ):
+                        self.build()
+                    self.version = version
+
+
+class IngredientPrefixIndex(VersionedSnapshot):
+    """Process-local ingredient index for autocomplete.
+
+    Ingredients are kept in a list sorted by casefolded name, so prefix
+    matches are one bisect away and substring matches are a linear scan
+    over a couple of thousand strings. The index is rebuilt whenever the
+    ingredients cache version changes.
+    """
+
+    version_key = INGREDIENTS_VERSION_KEY
+    stamp_model = Ingredient
+
+    def __init__(self):
+        super().__init__()
+        self.entries = ([], [])
+
+    def build(self):
+        items = sorted(
+            (
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).order_by()
+            ),
+            key=lambda item: (item['name'].casefold(), item['id'])
+        )
+        self.entries = ([item['name'].casefold() for item in items], items)
+
+    def search(self, query, limit=None):
+        """Prefix matches first, then substring matches, up to limit."""
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = query.casefold()
+        self.ensure_fresh()
+        keys, items = self.entries
+        start = bisect.bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit and (
+            keys[end].startswith(query)
+        ):
+            end += 1
+        result = items[start:end]
+        if len(result) < limit:
+            for key, item in zip(keys, items):
+                if query in key and not key.startswith(query):
+                    result.append(item)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+class IngredientCatalogue(VersionedSnapshot):
+    """The whole ingredient list, rendered and compressed once.
+
+    Bodies are keyed by content encoding; the version is a hash of the
+    JSON, so clients can cache a versioned URL forever.
+    """
+
+    version_key = INGREDIENTS_VERSION_KEY
+    stamp_model = Ingredient
+
+    def __init__(self):
+        super().__init__()
+        self.snapshot = ('', {})
+
+    def build(self):
+        content = JSONRenderer().render(
+            IngredientSerializer(Ingredient.objects.all(), many=True).data
+        )
+        bodies = {
+            'identity': content,
+            'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            bodies['br'] = brotli.compress(content)
+        self.snapshot = (hashlib.sha256(content).hexdigest()[:16], bodies)
+
+    def get(self):
+        """Content hash and bodies by encoding."""
+        self.ensure_fresh()
+        return self.snapshot
+
+
+class PantryIndex(VersionedSnapshot):
+    """Process-local inverted index from ingredients to recipes.
+
+    Every ingredient maps to an array of recipe positions, so a pantry
+    query is one bincount over the postings of its ingredients: the count
+    per recipe is how many of its ingredients are at hand. Changes are
+    applied per recipe from the journal of the namespace; the index is
+    rebuilt only when the journal has a gap or too many recipes changed.
+    """
+
+    version_key = RECIPE_INGREDIENTS_VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self.snapshot = (
+            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), {}, {}
+        )
+
+    def build(self):
+        rows = IngredientRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        pairs = np.fromiter(
+            chain.from_iterable(rows.iterator(chunk_size=10000)),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        recipe_ids, positions, sizes = np.unique(
+            pairs[:, 0], return_inverse=True, return_counts=True
+        )
+        starts = np.concatenate(([0], np.cumsum(sizes)))
+        members = {
+            recipe_id: (position, pairs[start:end, 1])
+            for position, (recipe_id, start, end) in enumerate(zip(
+                recipe_ids.tolist(), starts[:-1], starts[1:]
+            ))
+        }
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredient_ids, starts = np.unique(
+            pairs[order, 1], return_index=True
+        )
+        ends = np.append(starts[1:], len(order))
+        postings = {
+            ingredient_id: positions[order[start:end]].astype(np.int32)
+            for ingredient_id, start, end in zip(
+                ingredient_ids.tolist(), starts, ends
+            )
+        }
+        self.snapshot = (recipe_ids, sizes, postings, members)
+
+    def update(self, old_version, version):
+        """Re-read the ingredients of recipes changed since old_version.
+
+        The new arrays and dicts are built aside and swapped in at once,
+        so concurrent searches keep working on the old snapshot. Deleted
+        recipes keep their position with no ingredients until the next
+        build.
+        """
+        changes = get_namespace_changes(
+            self.version_key,
+            old_version[0],
+            version[0],
+            settings.PANTRY_MAX_DELTA
+        )
+        if changes is None:
+            return False
+        changed = set(chain.from_iterable(changes))
+        if len(changed) > settings.PANTRY_MAX_DELTA:
+            return False
+        current = {recipe_id: [] for recipe_id in changed}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=changed
+        ).order_by().values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].append(ingredient_id)
+        recipe_ids, sizes, postings, members = self.snapshot
+        members = dict(members)
+        new_ids = [
+            recipe_id for recipe_id in sorted(changed)
+            if recipe_id not in members and current[recipe_id]
+        ]
+        for position, recipe_id in enumerate(new_ids, len(recipe_ids)):
+            members[recipe_id] = (position, np.zeros(0, dtype=np.int64))
+        recipe_ids = np.append(recipe_ids, new_ids).astype(np.int64)
+        sizes = np.append(sizes, np.zeros(len(new_ids), dtype=np.int64))
+        removed, added = {}, {}
+        for recipe_id in changed & members.keys():
+            position, old = members[recipe_id]
+            new = np.unique(current[recipe_id]).astype(np.int64)
+            for ingredient_id in np.setdiff1d(old, new).tolist():
+                removed.setdefault(ingredient_id, []).append(position)
+            for ingredient_id in np.setdiff1d(new, old).tolist():
+                added.setdefault(ingredient_id, []).append(position)
+            members[recipe_id] = (position, new)
+            sizes[position] = len(new)
+        postings = dict(postings)
+        for ingredient_id in removed.keys() | added.keys():
+            positions = postings.get(ingredient_id, np.zeros(0, np.int32))
+            positions = np.append(
+                positions[~np.isin(positions, removed.get(ingredient_id, []))],
+                added.get(ingredient_id, [])
+            ).astype(np.int32)
+            if len(positions):
+                postings[ingredient_id] = positions
+            else:
+                postings.pop(ingredient_id, None)
+        self.snapshot = (recipe_ids, sizes, postings, members)
+        return True
+
+    def search(self, ingredient_ids, min_coverage):
+        """(recipe id, coverage) pairs, best covered first.
+
+        Coverage is the share of a recipe's ingredients found among
+        ingredient_ids; ties go to recipes missing fewer ingredients,
+        then to newer ones.
+        """
+        self.ensure_fresh()
+        recipe_ids, sizes, postings, _ = self.snapshot
+        lists = [
+            postings[ingredient_id] for ingredient_id in set(ingredient_ids)
+            if ingredient_id in postings
+        ]
+        if not lists:
+            return []
+        matched = np.bincount(
+            np.concatenate(lists), minlength=len(recipe_ids)
+        )
+        coverage = matched / np.maximum(sizes, 1)
+        found = np.flatnonzero((matched > 0) & (coverage >= min_coverage))
+        found = found[np.lexsort((
+            -recipe_ids[found],
+            sizes[found] - matched[found],
+            -coverage[found]
+        ))]
+        return list(zip(
+            recipe_ids[found].tolist(), coverage[found].tolist()
+        ))
+
+
+ingredient_index = IngredientPrefixIndex()
+ingredient_catalogue = IngredientCatalogue()
+pantry_index = PantryIndex()
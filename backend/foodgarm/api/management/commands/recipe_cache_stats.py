@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_recipe_list_stats, reset_recipe_list_stats
+
+
+class Command(BaseCommand):
+    help = 'Hit/miss counters of the anonymous recipe list cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after printing them.'
+        )
+
+    def handle(self, *args, **options):
+        stats = get_recipe_list_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'hits: {stats["hits"]}, misses: {stats["misses"]}, '
+            f'hit ratio: {ratio:.1%}'
+        )
+        if options['reset']:
+            reset_recipe_list_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
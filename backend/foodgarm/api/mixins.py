@@ -0,0 +1,64 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache import get_namespace_state, user_version_key
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified for list and retrieve, answering 304 early.
+
+    Validators are derived from cache namespace versions bumped by
+    api.signals, so nothing is queried or serialized for a 304.
+    Last-Modified is informational only: it has one-second resolution,
+    so two writes within a second would leave If-Modified-Since
+    unchanged. Only If-None-Match can produce a 304.
+    """
+
+    version_keys = ()
+    per_user = False
+
+    def get_version_keys(self, request):
+        keys = list(self.version_keys)
+        if self.per_user and request.user.is_authenticated:
+            keys.append(user_version_key(request.user.id))
+        return keys
+
+    def get_validators(self, request, *args, **kwargs):
+        versions, last_modified = get_namespace_state(
+            self.get_version_keys(request)
+        )
+        source = repr((
+            self.basename,
+            self.action,
+            kwargs.get(self.lookup_url_kwarg or self.lookup_field),
+            versions,
+            request.user.id if self.per_user else None,
+            sorted(request.query_params.lists()),
+            request.accepted_renderer.format,
+        ))
+        etag = '"{}"'.format(hashlib.md5(source.encode()).hexdigest())
+        return etag, last_modified
+
+    def conditional(self, view_method, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view_method(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = (
+            'private, no-cache' if self.per_user else 'no-cache'
+        )
+        if self.per_user:
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -1,5 +1,104 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CastomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class CastomCursorPagination(CursorPagination):
+    """Keyset pagination by -id: no COUNT(*) and no OFFSET scan."""
+
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+
+class CursorSwitchPagination(BasePagination):
+    """Page numbers by default, cursor on ?pagination=cursor or ?cursor=.
+
+    The cursor orders by -id, which would drop the relevance ranking of a
+    full-text search, so searches always get page numbers.
+    """
+
+    mode_query_param = 'pagination'
+    ranked_query_params = ('search',)
+
+    def use_cursor(self, request):
+        if any(
+            request.query_params.get(param, '').strip()
+            for param in self.ranked_query_params
+        ):
+            return False
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or CastomCursorPagination.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.paginator = CastomCursorPagination()
+        else:
+            self.paginator = CastomPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return CastomPagination().get_paginated_response_schema(schema)
+
+
+class FeedPagination(BasePagination):
+    """Keyset pagination over descending recipe ids of a merged feed."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK['PAGE_SIZE']
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None
+        try:
+            return int(cursor)
+        except ValueError:
+            raise NotFound('Invalid cursor')
+
+    def paginate_ids(self, fetch_ids, request):
+        """fetch_ids(before, limit) returns ids in descending order."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        ids = fetch_ids(self.get_cursor(request), page_size + 1)
+        self.next_cursor = ids[page_size - 1] if len(ids) > page_size else None
+        return ids[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data
+        })
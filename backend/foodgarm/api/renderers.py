@@ -0,0 +1,36 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ShoppingListRenderer(JSONRenderer):
+    """Content negotiation for shopping list formats.
+
+    The list itself is streamed by the view; render() is only used for
+    error responses, which are sent as application/json whatever format
+    was negotiated.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return super().render(
+            data, JSONRenderer.media_type, renderer_context
+        )
+
+
+class TxtRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+SHOPPING_LIST_RENDERERS = (TxtRenderer, CSVRenderer, JSONRenderer, PDFRenderer)
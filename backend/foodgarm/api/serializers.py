@@ -1,9 +1,12 @@
 import base64
+import binascii
+import hashlib
 
-from django.db import IntegrityError
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
@@ -13,22 +16,126 @@ from recipes.models import (
     Recipe,
     IngredientRecipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
+from recipes.signals import ingredients_changed
 from users.models import User, Follow
 
 
 class Base64ImageField(serializers.ImageField):
-    """For images."""
+    """For images.
+
+    Data URIs are decoded chunk by chunk into a named temporary file.
+    Pillow verifies it by path and the storage moves it into place, so
+    the decoded image is never read into memory as a whole. The file is
+    closed by the serializer once the recipe is saved.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Изображение должно быть закодировано в base64.',
+    }
+    chunk_size = 64 * 1024
+    signatures = (
+        (b'\x89PNG\r\n\x1a\n', 'png'),
+        (b'\xff\xd8\xff', 'jpg'),
+        (b'GIF87a', 'gif'),
+        (b'GIF89a', 'gif'),
+        (b'BM', 'bmp'),
+    )
+
+    def sniff_extension(self, header, default):
+        """Image format by its first bytes."""
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return 'webp'
+        for signature, extension in self.signatures:
+            if header.startswith(signature):
+                return extension
+        return default
+
+    def decode(self, data, start, max_size):
+        """Decode data[start:] into a temporary file of at most max_size."""
+        tail = data[-4:]
+        padding = len(tail) - len(tail.rstrip('='))
+        if (len(data) - start) * 3 // 4 - padding > max_size:
+            self.fail('too_large', max_size=max_size)
+        file = TemporaryUploadedFile('temp', None, 0, None)
+        try:
+            size = 0
+            header = b''
+            sha256 = hashlib.sha256()
+            rest = ''
+            for offset in range(start, len(data), self.chunk_size):
+                chunk = rest + ''.join(
+                    data[offset:offset + self.chunk_size].split()
+                )
+                cut = len(chunk) - len(chunk) % 4
+                chunk, rest = chunk[:cut], chunk[cut:]
+                decoded = base64.b64decode(chunk, validate=True)
+                size += len(decoded)
+                if size > max_size:
+                    self.fail('too_large', max_size=max_size)
+                if len(header) < 16:
+                    header += decoded[:16]
+                sha256.update(decoded)
+                file.write(decoded)
+            if rest:
+                self.fail('invalid_base64')
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        file.size = size
+        file.content_hash = sha256.hexdigest()
+        return file, header
 
     def to_internal_value(self, data):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            start = data.find(';base64,')
+            if start == -1:
+                self.fail('invalid_base64')
+            ext = data[:start].split('/')[-1]
+            data, header = self.decode(data, start + len(';base64,'), max_size)
+            data.name = 'temp.' + self.sniff_extension(header, ext)
+        elif getattr(data, 'size', 0) > max_size:
+            self.fail('too_large', max_size=max_size)
         return super().to_internal_value(data)
 
 
+class ImageSizesField(serializers.Field):
+    """Derivative URLs by width, pointing at the original until ready."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        original = {'default': self.url(recipe.image.url)}
+        derivatives = recipe.image_derivatives
+        if derivatives.get('source') != recipe.image.name:
+            derivatives = {}
+        sizes = derivatives.get('sizes', {})
+        return {
+            str(width): {
+                format: self.url(default_storage.url(name))
+                for format, name in sizes[str(width)].items()
+            } if str(width) in sizes else original
+            for width in settings.RECIPE_IMAGE_WIDTHS
+        }
+
+
 class UserSignUpSerializer(UserCreateSerializer):
     """User registration."""
 
@@ -61,6 +168,9 @@ class UserGetSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        annotated = getattr(obj, 'is_subscribed', None)
+        if annotated is not None:
+            return annotated
         request = self.context.get('request')
         return (
             request.user.is_authenticated and Follow.objects.filter(
@@ -72,9 +182,11 @@ class UserGetSerializer(UserSerializer):
 class RecipeBitSerializer(serializers.ModelSerializer):
     """Brief information about the recipe."""
 
+    image_sizes = ImageSizesField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_sizes', 'cooking_time')
 
 
 class UserFollowInfoSerializer(UserGetSerializer):
@@ -106,18 +218,42 @@ class UserFollowInfoSerializer(UserGetSerializer):
             'recipes_count'
         )
 
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            return int(request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+
+    @classmethod
+    def prefetch_recipes(cls, authors, request):
+        """Load the recipe previews of all authors with one query."""
+        recipes = Recipe.objects.latest_by_author(
+            [author.id for author in authors],
+            cls.get_recipes_limit(request),
+            fields=(
+                'id', 'name', 'image', 'image_derivatives', 'cooking_time'
+            )
+        )
+        for author in authors:
+            author.latest_recipes = recipes[author.id]
+        return authors
+
     def get_recipes(self, obj):
-        recipes_limit = (
-            self.context.get('request').query_params.get('recipes_limit'))
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                recipes = obj.recipes.all()
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            recipes_limit = self.get_recipes_limit(
+                self.context.get('request')
+            )
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeBitSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        annotated = getattr(obj, 'recipes_count', None)
+        if annotated is not None:
+            return annotated
         return obj.recipes.count()
 
 
@@ -144,8 +280,12 @@ class UserFollowSerializer(serializers.ModelSerializer):
 
     def to_representation(self, value):
         request = self.context.get('request')
+        author = User.objects.with_is_subscribed(
+            request.user
+        ).with_recipes_count().get(pk=value.author_id)
+        UserFollowInfoSerializer.prefetch_recipes([author], request)
         return UserFollowInfoSerializer(
-            value.author, context={'request': request}
+            author, context={'request': request}
         ).data
 
 
@@ -210,6 +350,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_sizes = ImageSizesField()
 
     class Meta:
         model = Recipe
@@ -222,21 +363,25 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_sizes',
             'text',
             'cooking_time'
         )
 
-    def recipe_get(self, model, obj):
+    def recipe_get(self, model, obj, field):
+        annotated = getattr(obj, field, None)
+        if annotated is not None:
+            return annotated
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return model.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_favorited(self, obj):
-        return self.recipe_get(Favorite, obj)
+        return self.recipe_get(Favorite, obj, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.recipe_get(ShoppingCart, obj)
+        return self.recipe_get(ShoppingCart, obj, 'is_in_shopping_cart')
 
 
 class RecipeNotSafeMetodSerialaizer(serializers.ModelSerializer):
@@ -271,6 +416,14 @@ class RecipeNotSafeMetodSerialaizer(serializers.ModelSerializer):
             )
         ]
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def validate_cooking_time(self, value):
         if value < 1:
             raise serializers.ValidationError(
@@ -281,43 +434,55 @@ class RecipeNotSafeMetodSerialaizer(serializers.ModelSerializer):
     def validate(self, attrs):
         ingredients = attrs.get('ingredientrecipes')
         tags = attrs.get('tags')
-        if not tags:
+        if not tags and (not self.partial or 'tags' in attrs):
             raise serializers.ValidationError(
                 'Нужно выбрать хотя бы 1 тег!'
             )
+        if ingredients is None and self.partial:
+            return attrs
         if not ingredients:
             raise serializers.ValidationError(
                 'Нужно выбрать хотя бы 1 ингредиент!'
             )
-        unique_ingredients = []
-        for ingredient in ingredients:
-            try:
-                item = Ingredient.objects.get(
-                    id=ingredient.get('id')
-                )
-            except ObjectDoesNotExist:
-                raise serializers.ValidationError(
-                    'Такого индигриента не существует.'
-                )
-            if item in unique_ingredients:
-                raise serializers.ValidationError(
-                    'Индигриенты должны быть уникальны.'
-                )
-            unique_ingredients.append(item)
+        ingredient_ids = [ingredient.get('id') for ingredient in ingredients]
+        existing = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        missing = [
+            ingredient_id for ingredient_id in ingredient_ids
+            if ingredient_id not in existing
+        ]
+        if missing:
+            raise serializers.ValidationError({
+                'non_field_errors': ['Такого индигриента не существует.'],
+                'ingredients_ids': missing,
+            })
+        duplicates = self.find_duplicates(ingredient_ids)
+        if duplicates:
+            raise serializers.ValidationError({
+                'non_field_errors': ['Индигриенты должны быть уникальны.'],
+                'ingredients_ids': duplicates,
+            })
         return attrs
 
+    def find_duplicates(self, values):
+        seen = set()
+        duplicates = {}
+        for value in values:
+            if value in seen:
+                duplicates[value] = None
+            seen.add(value)
+        return list(duplicates)
+
     def validate_tags(self, tags):
-        unique_tags = []
         if not tags:
             raise serializers.ValidationError(
                 'Нужно выбрать хотя бы 1 тег!'
             )
-        for tag in tags:
-            if tag in unique_tags:
-                raise serializers.ValidationError(
-                    'Теги должны быть уникальны.'
-                )
-            unique_tags.append(tag)
+        if self.find_duplicates(tag.id for tag in tags):
+            raise serializers.ValidationError(
+                'Теги должны быть уникальны.'
+            )
         return tags
 
     def add_ingredients(self, ingredients, recipe):
@@ -335,31 +500,86 @@ class RecipeNotSafeMetodSerialaizer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredientrecipes')
         tags = validated_data.pop('tags')
         try:
-            recipe = Recipe.objects.create(
-                author=self.context.get('request').user,
-                **validated_data
-            )
-            recipe.tags.set(tags)
-            self.add_ingredients(ingredients, recipe)
+            with transaction.atomic():
+                recipe = Recipe.objects.create(
+                    author=self.context.get('request').user,
+                    **validated_data
+                )
+                recipe.tags.set(tags)
+                self.add_ingredients(ingredients, recipe)
+                ingredients_changed.send(
+                    sender=Recipe, recipe_ids=[recipe.pk]
+                )
             return recipe
         except IntegrityError:
             raise serializers.ValidationError(
                 'Такой рецепт уже существует!'
             )
 
+    def update_ingredients(self, instance, ingredients):
+        """Write only the ingredient rows that changed.
+
+        Bulk writes skip model signals, so ingredients_changed is sent
+        once the rows are written.
+        """
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=instance)
+        }
+        new = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        deltas = {
+            ingredient_id: new.get(ingredient_id, 0) - (
+                current[ingredient_id].amount
+                if ingredient_id in current else 0
+            )
+            for ingredient_id in current.keys() | new.keys()
+        }
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=instance,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            if ingredient_id in new and row.amount != new[ingredient_id]:
+                row.amount = new[ingredient_id]
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ]
+        if added:
+            self.add_ingredients(added, instance)
+        if removed or changed or added:
+            ingredients_changed.send(sender=Recipe, recipe_ids=[instance.pk])
+        ShoppingListItem.objects.apply_deltas(
+            instance.shopping_carts.values_list('user_id', flat=True),
+            deltas
+        )
+
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredientrecipes')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        super().update(instance, validated_data)
-        self.add_ingredients(ingredients, instance)
-        instance.save()
+        ingredients = validated_data.pop('ingredientrecipes', None)
+        tags = validated_data.pop('tags', None)
+        with transaction.atomic():
+            if tags is not None:
+                instance.tags.set(tags)
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if validated_data:
+                instance.save(update_fields=validated_data.keys())
         return instance
 
     def to_representation(self, value):
         request = self.context.get('request')
+        value = Recipe.objects.with_related(request.user).get(pk=value.pk)
         return RecipeSerializer(
             value,
             context={'request': request}
@@ -408,3 +628,28 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             instance.recipe,
             context={'request': request}
         ).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """List of recipe ids for bulk favorite/shopping cart changes."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    """Ingredients at hand and the share of a recipe they must cover."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=500
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0,
+        max_value=1,
+        default=settings.PANTRY_MIN_COVERAGE
+    )
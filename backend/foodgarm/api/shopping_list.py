@@ -0,0 +1,92 @@
+import csv
+import json
+import tempfile
+
+from django.conf import settings
+
+from recipes.models import ShoppingListItem
+
+CHUNK_SIZE = 2000
+
+
+def shopping_list_rows(user):
+    """(name, amount, unit) rows sorted by ingredient, read lazily."""
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).order_by(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).values_list(
+        'ingredient__name',
+        'amount',
+        'ingredient__measurement_unit'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_txt(rows):
+    yield 'Ваш список покупок:'
+    for name, amount, unit in rows:
+        yield f'\n{name} - {amount} {unit}.'
+
+
+class Echo:
+    """File-like object handing csv.writer output back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(rows):
+    separator = '['
+    for name, amount, unit in rows:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount, 'measurement_unit': unit},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def write_pdf(rows):
+    """Render the list to a temporary file, one page at a time."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    if 'ShoppingList' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont('ShoppingList', settings.SHOPPING_LIST_PDF_FONT)
+        )
+    output = tempfile.TemporaryFile()
+    pdf = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    pdf.setFont('ShoppingList', 16)
+    pdf.drawString(margin, height - margin, 'Ваш список покупок:')
+    y = height - margin - 2 * line_height
+    pdf.setFont('ShoppingList', 12)
+    for name, amount, unit in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont('ShoppingList', 12)
+            y = height - margin
+        pdf.drawString(margin, y, f'{name} - {amount} {unit}.')
+        y -= line_height
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+SHOPPING_LIST_STREAMS = {
+    'txt': stream_txt,
+    'csv': stream_csv,
+    'json': stream_json,
+}
@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag
+)
+from recipes.signals import ingredients_changed
+from users.models import Follow, User
+from .cache import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPE_INGREDIENTS_VERSION_KEY,
+    TAGS_VERSION_KEY,
+    bump_namespace_version,
+    invalidate_recipe_fragments,
+    invalidate_recipe_lists,
+    log_namespace_change,
+    user_version_key
+)
+
+
+def invalidate_recipes(recipe_ids=None):
+    """Invalidate recipe caches once the current transaction commits."""
+    def invalidate():
+        invalidate_recipe_lists()
+        invalidate_recipe_fragments(recipe_ids)
+    transaction.on_commit(invalidate)
+
+
+class RecipeIngredientsInvalidation:
+    """Recipe ids with changed ingredients, handled once on commit."""
+
+    def __init__(self):
+        self.recipe_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        recipe_ids = sorted(self.recipe_ids)
+        invalidate_recipe_lists()
+        invalidate_recipe_fragments(recipe_ids)
+        log_namespace_change(RECIPE_INGREDIENTS_VERSION_KEY, recipe_ids)
+
+
+def invalidate_recipe_ingredients(recipe_ids):
+    """Recipe caches and the pantry index, once the transaction commits.
+
+    One callback per transaction collects every changed recipe, so
+    deleting a recipe with forty ingredients makes one journal entry, not
+    forty. A callback that already ran, or was dropped with a rolled back
+    savepoint, is not reused: the next change registers a new one.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'recipe_ingredients_invalidation', None)
+    if pending is None or pending.done or not any(
+        callback is pending for _, callback in connection.run_on_commit
+    ):
+        pending = RecipeIngredientsInvalidation()
+        connection.recipe_ingredients_invalidation = pending
+        pending.recipe_ids.update(recipe_ids)
+        transaction.on_commit(pending)
+    else:
+        pending.recipe_ids.update(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_ingredients([instance.recipe_id])
+
+
+@receiver(ingredients_changed)
+def recipe_ingredients_bulk_changed(sender, recipe_ids, **kwargs):
+    invalidate_recipe_ingredients(recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.pk])
+    elif pk_set is None:
+        invalidate_recipes()
+    elif pk_set:
+        invalidate_recipes(list(pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate_recipes()
+    transaction.on_commit(lambda: bump_namespace_version(TAGS_VERSION_KEY))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate_recipes()
+    transaction.on_commit(
+        lambda: bump_namespace_version(INGREDIENTS_VERSION_KEY)
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def user_state_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: bump_namespace_version(user_version_key(instance.user_id))
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        invalidate_recipes(recipe_ids)
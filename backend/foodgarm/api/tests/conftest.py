@@ -0,0 +1,93 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def make_user():
+    def make(username):
+        return User.objects.create_user(
+            username=username,
+            email=f'{username}@example.com',
+            password='password',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('user')
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def tags():
+    return [
+        Tag.objects.create(name=f'Тег {n}', color=f'#00000{n}', slug=f'tag{n}')
+        for n in range(3)
+    ]
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(
+            name=f'Ингредиент {n}', measurement_unit='г'
+        )
+        for n in range(20)
+    ]
+
+
+@pytest.fixture
+def make_recipes(tags, ingredients):
+    """Recipes of an author, each with two tags and five ingredients."""
+    def make(author, count, ingredients_count=5):
+        recipes = []
+        for n in range(count):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {author.pk}-{n}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.png'
+            )
+            recipe.tags.set([tags[n % 3], tags[(n + 1) % 3]])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=ingredients[(n + k) % len(ingredients)],
+                    amount=k + 1
+                )
+                for k in range(ingredients_count)
+            )
+            recipes.append(recipe)
+        return recipes
+    return make
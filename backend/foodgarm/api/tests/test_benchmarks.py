@@ -0,0 +1,153 @@
+"""Benchmarks of the heavy endpoints.
+
+They assert only what does not depend on the machine: query counts and
+peak memory. Timings are printed; run pytest -m benchmark -s to see them.
+"""
+import base64
+import io
+import time
+import tracemalloc
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from recipes.models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+
+def get_body(client, url, params):
+    response = client.get(url, params)
+    assert response.status_code == 200
+    return b''.join(response.streaming_content)
+
+
+def measure(client, url, params=None):
+    """Response body, query count, seconds and peak traced memory.
+
+    Memory is traced in a second request, so tracing does not slow down
+    the timed one.
+    """
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as context:
+        body = get_body(client, url, params)
+    seconds = time.perf_counter() - start
+    queries = len(context)
+    tracemalloc.start()
+    get_body(client, url, params)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return body, queries, seconds, peak
+
+
+def fill_cart(user, author, recipes_count, ingredients_per_recipe=12):
+    """A cart of recipes whose ingredients barely overlap."""
+    ingredients_count = recipes_count * ingredients_per_recipe // 2
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Продукт {user.pk}-{n:05}', measurement_unit='г')
+        for n in range(ingredients_count)
+    )
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith=f'Продукт {user.pk}-'
+    ).values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=author,
+            name=f'Рецепт {user.pk}-{n}',
+            text='Описание',
+            cooking_time=10
+        )
+        for n in range(recipes_count)
+    )
+    recipe_ids = list(Recipe.objects.filter(
+        name__startswith=f'Рецепт {user.pk}-'
+    ).values_list('id', flat=True))
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_ids[
+                (n * ingredients_per_recipe // 2 + k) % ingredients_count
+            ],
+            amount=k + 1
+        )
+        for n, recipe_id in enumerate(recipe_ids)
+        for k in range(ingredients_per_recipe)
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    )
+    ShoppingListItem.objects.add_recipes([user.id], recipe_ids)
+    return ingredients_count
+
+
+@pytest.mark.parametrize('format', ('txt', 'csv', 'json', 'pdf'))
+def test_shopping_list_of_hundreds_of_recipes(
+    format, client, make_user, author
+):
+    small_user, large_user = make_user('small'), make_user('large')
+    fill_cart(small_user, author, 3)
+    rows = fill_cart(large_user, author, 500)
+    url = '/api/recipes/download_shopping_cart/'
+    results = {}
+    for user in (small_user, large_user):
+        client.force_authenticate(user)
+        results[user] = measure(client, url, {'format': format})
+    small, large = results[small_user], results[large_user]
+    print(
+        f'\n{format}: 500 recipes, {rows} rows, {len(large[0])} bytes, '
+        f'{large[1]} queries, {large[2] * 1000:.0f} ms, '
+        f'peak {large[3] // 1024} KiB'
+    )
+    assert large[1] == small[1]
+    assert large[3] < 4 * 1024 * 1024
+
+
+def png_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def test_create_large_recipes(settings, tmp_path, user_client, tags):
+    settings.MEDIA_ROOT = tmp_path
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Продукт {n:03}', measurement_unit='г')
+        for n in range(200)
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    image = png_image()
+    counts = {}
+    for size in (10, 50, 200):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            response = user_client.post('/api/recipes/', {
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': 2}
+                    for ingredient_id in ingredient_ids[:size]
+                ],
+                'tags': [tag.id for tag in tags],
+                'image': image,
+                'name': f'Рецепт на {size} продуктов',
+                'text': 'Описание',
+                'cooking_time': 10
+            }, format='json')
+        seconds = time.perf_counter() - start
+        assert response.status_code == 201, response.data
+        assert len(response.data['ingredients']) == size
+        counts[size] = len(context)
+        print(
+            f'\n{size} ingredients: {counts[size]} queries, '
+            f'{seconds * 1000:.0f} ms'
+        )
+    assert counts[10] == counts[50] == counts[200]
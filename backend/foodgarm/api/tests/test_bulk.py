@@ -0,0 +1,79 @@
+import pytest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('action, model', (
+    ('favorite', Favorite), ('shopping_cart', ShoppingCart)
+))
+def test_bulk_add_reports_each_recipe(
+    user, user_client, author, make_recipes, action, model
+):
+    first, second = make_recipes(author, 2)
+    model.objects.create(user=user, recipe=first)
+    missing = second.id + 1000
+    response = user_client.post(
+        f'/api/recipes/{action}/',
+        {'recipes': [first.id, second.id, second.id, missing]},
+        format='json'
+    )
+    assert response.status_code == 200
+    assert response.data == [
+        {'id': first.id, 'status': 'already_added'},
+        {'id': second.id, 'status': 'added'},
+        {'id': second.id, 'status': 'added'},
+        {'id': missing, 'status': 'not_found'},
+    ]
+    assert set(model.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    )) == {first.id, second.id}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('action, model', (
+    ('favorite', Favorite), ('shopping_cart', ShoppingCart)
+))
+def test_bulk_remove_reports_each_recipe(
+    user, user_client, author, make_recipes, action, model
+):
+    first, second = make_recipes(author, 2)
+    user_client.post(
+        f'/api/recipes/{action}/', {'recipes': [first.id]}, format='json'
+    )
+    missing = second.id + 1000
+    response = user_client.delete(
+        f'/api/recipes/{action}/',
+        {'recipes': [first.id, first.id, second.id, missing]},
+        format='json'
+    )
+    assert response.status_code == 200
+    assert response.data == [
+        {'id': first.id, 'status': 'removed'},
+        {'id': first.id, 'status': 'removed'},
+        {'id': second.id, 'status': 'not_in_list'},
+        {'id': missing, 'status': 'not_found'},
+    ]
+    assert not model.objects.filter(user=user).exists()
+    assert Recipe.objects.get(pk=first.pk).favorites_count == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('payload', (
+    {}, {'recipes': []}, {'recipes': ['x']}, {'recipes': [0]},
+    {'recipes': list(range(1, 502))},
+))
+def test_bulk_rejects_invalid_payload(user_client, payload):
+    response = user_client.post(
+        '/api/recipes/favorite/', payload, format='json'
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_bulk_requires_authentication(client, author, make_recipes):
+    recipe, = make_recipes(author, 1)
+    response = client.post(
+        '/api/recipes/favorite/', {'recipes': [recipe.id]}, format='json'
+    )
+    assert response.status_code == 401
@@ -0,0 +1,26 @@
+from api.cache import (
+    get_namespace_changes,
+    get_recipe_fragments,
+    invalidate_recipe_fragments,
+    set_recipe_fragments
+)
+
+
+def test_fragment_built_before_invalidation_is_not_served():
+    keys, fragments = get_recipe_fragments([1, 2])
+    assert fragments == {}
+    invalidate_recipe_fragments([1])
+    set_recipe_fragments(keys, {1: {'name': 'old'}, 2: {'name': 'same'}})
+    assert get_recipe_fragments([1, 2])[1] == {2: {'name': 'same'}}
+
+
+def test_invalidating_all_fragments():
+    keys, _ = get_recipe_fragments([1, 2])
+    set_recipe_fragments(keys, {1: {'name': 'one'}, 2: {'name': 'two'}})
+    invalidate_recipe_fragments()
+    assert get_recipe_fragments([1, 2])[1] == {}
+
+
+def test_namespace_changes_are_not_read_across_a_large_gap():
+    assert get_namespace_changes('test:version', 10, 10 ** 12, 1000) is None
+    assert get_namespace_changes('test:version', 10, 5, 1000) is None
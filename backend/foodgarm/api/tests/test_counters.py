@@ -0,0 +1,81 @@
+import pytest
+from django.core.management import call_command
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+def counters(recipe):
+    return tuple(Recipe.objects.filter(pk=recipe.pk).values_list(
+        'favorites_count', 'in_carts_count'
+    ).get())
+
+
+@pytest.mark.django_db
+def test_counters_follow_single_endpoints(user_client, author, make_recipes):
+    recipe, = make_recipes(author, 1)
+    for action in ('favorite', 'shopping_cart'):
+        url = f'/api/recipes/{recipe.id}/{action}/'
+        assert user_client.post(url).status_code == 201
+    assert counters(recipe) == (1, 1)
+    assert user_client.delete(
+        f'/api/recipes/{recipe.id}/favorite/'
+    ).status_code == 204
+    assert counters(recipe) == (0, 1)
+
+
+@pytest.mark.django_db
+def test_counters_follow_bulk_endpoints(user_client, author, make_recipes):
+    first, second, third = make_recipes(author, 3)
+    response = user_client.post(
+        '/api/recipes/favorite/',
+        {'recipes': [first.id, second.id]},
+        format='json'
+    )
+    assert response.status_code == 200
+    user_client.post(
+        '/api/recipes/shopping_cart/', {'recipes': [first.id]}, format='json'
+    )
+    assert [counters(recipe) for recipe in (first, second, third)] == [
+        (1, 1), (1, 0), (0, 0)
+    ]
+    user_client.delete(
+        '/api/recipes/favorite/', {'recipes': [first.id]}, format='json'
+    )
+    assert [counters(recipe) for recipe in (first, second, third)] == [
+        (0, 1), (1, 0), (0, 0)
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('bulk', [False, True])
+def test_drifted_counter_does_not_go_below_zero(
+    user, user_client, author, make_recipes, bulk
+):
+    recipe, = make_recipes(author, 1)
+    Favorite.objects.create(user=user, recipe=recipe)
+    if bulk:
+        response = user_client.delete(
+            '/api/recipes/favorite/', {'recipes': [recipe.id]}, format='json'
+        )
+        assert response.status_code == 200
+        assert response.data == [{'id': recipe.id, 'status': 'removed'}]
+    else:
+        response = user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        assert response.status_code == 204
+    assert counters(recipe) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_recount_recipe_counters_repairs_drift(
+    user, make_user, author, make_recipes
+):
+    first, second = make_recipes(author, 2)
+    for favorite_user in (user, make_user('other')):
+        Favorite.objects.create(user=favorite_user, recipe=first)
+    ShoppingCart.objects.create(user=user, recipe=second)
+    Recipe.objects.filter(pk=second.pk).update(favorites_count=5)
+    call_command('recount_recipe_counters', '--dry-run')
+    assert counters(first) == (0, 0)
+    call_command('recount_recipe_counters')
+    assert counters(first) == (2, 0)
+    assert counters(second) == (0, 1)
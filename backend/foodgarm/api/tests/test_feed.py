@@ -0,0 +1,106 @@
+import pytest
+from django.core.management import call_command
+
+from recipes import signals
+from recipes.models import TimelineEntry
+from users.models import Follow
+
+URL = '/api/recipes/feed/'
+
+
+@pytest.fixture(autouse=True)
+def run_in_foreground(monkeypatch):
+    monkeypatch.setattr(
+        signals, 'submit_on_commit', lambda function, *args: function(*args)
+    )
+
+
+def feed_ids(client, **params):
+    response = client.get(URL, params)
+    assert response.status_code == 200
+    return [item['id'] for item in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_new_recipes_are_fanned_out(user, user_client, author, make_recipes):
+    Follow.objects.create(user=user, author=author)
+    recipes = make_recipes(author, 2)
+    assert set(TimelineEntry.objects.filter(user=user).values_list(
+        'recipe_id', flat=True
+    )) == {recipe.id for recipe in recipes}
+    assert feed_ids(user_client) == [recipe.id for recipe in recipes[::-1]]
+
+
+@pytest.mark.django_db
+def test_follow_backfills_and_unfollow_prunes(
+    user, user_client, author, make_user, make_recipes
+):
+    recipes = make_recipes(author, 3)
+    other = make_user('other')
+    other_recipe, = make_recipes(other, 1)
+    follow = Follow.objects.create(user=user, author=author)
+    Follow.objects.create(user=user, author=other)
+    assert feed_ids(user_client) == [other_recipe.id] + [
+        recipe.id for recipe in recipes[::-1]
+    ]
+    follow.delete()
+    assert feed_ids(user_client) == [other_recipe.id]
+    assert not TimelineEntry.objects.filter(author=author).exists()
+
+
+@pytest.mark.django_db
+def test_large_author_is_read_on_request(
+    user, user_client, author, make_recipes, settings
+):
+    settings.FEED_FANOUT_LIMIT = 0
+    Follow.objects.create(user=user, author=author)
+    TimelineEntry.objects.all().delete()
+    recipes = make_recipes(author, 2)
+    assert not TimelineEntry.objects.exists()
+    assert feed_ids(user_client) == [recipe.id for recipe in recipes[::-1]]
+
+
+@pytest.mark.django_db
+def test_author_dropping_below_limit_is_backfilled(
+    user, user_client, author, make_user, make_recipes, settings
+):
+    settings.FEED_FANOUT_LIMIT = 1
+    Follow.objects.create(user=user, author=author)
+    Follow.objects.create(user=make_user('other'), author=author)
+    recipe, = make_recipes(author, 1)
+    assert not TimelineEntry.objects.filter(recipe=recipe).exists()
+    Follow.objects.exclude(user=user).delete()
+    assert feed_ids(user_client) == [recipe.id]
+    assert TimelineEntry.objects.filter(user=user, recipe=recipe).exists()
+
+
+@pytest.mark.django_db
+def test_feed_pages_by_cursor(user, user_client, author, make_recipes):
+    Follow.objects.create(user=user, author=author)
+    recipes = make_recipes(author, 5)
+    expected = [recipe.id for recipe in recipes[::-1]]
+    seen = []
+    response = user_client.get(URL, {'limit': 2})
+    while True:
+        seen.extend(item['id'] for item in response.data['results'])
+        if response.data['next'] is None:
+            break
+        response = user_client.get(response.data['next'])
+    assert seen == expected
+
+
+@pytest.mark.django_db
+def test_rebuild_timelines_restores_lost_entries(
+    user, make_user, author, make_recipes
+):
+    Follow.objects.create(user=user, author=author)
+    recipes = make_recipes(author, 2)
+    stranger = make_user('stranger')
+    TimelineEntry.objects.all().delete()
+    TimelineEntry.objects.create(
+        user=stranger, recipe=recipes[0], author=author
+    )
+    call_command('rebuild_timelines')
+    assert set(TimelineEntry.objects.values_list('user_id', 'recipe_id')) == {
+        (user.id, recipe.id) for recipe in recipes
+    }
@@ -0,0 +1,110 @@
+import io
+import threading
+
+import pytest
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image
+
+from api.serializers import ImageSizesField
+from recipes import signals
+from recipes.images import build_derivatives, release_image
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def storage(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return Recipe._meta.get_field('image').storage
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+def make_recipe(author, image):
+    return Recipe.objects.create(
+        author=author,
+        name='Рецепт',
+        text='Описание',
+        cooking_time=10,
+        image=image
+    )
+
+
+@pytest.mark.django_db
+def test_release_keeps_referenced_image(author, storage, monkeypatch):
+    monkeypatch.setattr(signals, 'schedule_derivatives', lambda recipe: None)
+    name = storage.save('recipes/images/a.png', ContentFile(b'image'))
+    recipe = make_recipe(author, name)
+    release_image(name)
+    assert storage.exists(name)
+    recipe.delete()
+    release_image(name)
+    assert not storage.exists(name)
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='advisory locks need Postgres'
+)
+@pytest.mark.django_db(transaction=True)
+def test_release_waits_for_transaction_saving_same_image(
+    author, storage, monkeypatch
+):
+    monkeypatch.setattr(signals, 'schedule_derivatives', lambda recipe: None)
+    monkeypatch.setattr(signals, 'submit_on_commit', lambda *args: None)
+    name = storage.save('recipes/images/a.png', ContentFile(b'image'))
+
+    def release():
+        try:
+            release_image(name)
+        finally:
+            connection.close()
+
+    with transaction.atomic():
+        assert storage.save(
+            'recipes/images/b.png', ContentFile(b'image')
+        ) == name
+        releasing = threading.Thread(target=release)
+        releasing.start()
+        releasing.join(0.5)
+        assert releasing.is_alive()
+        make_recipe(author, name)
+    releasing.join(5)
+    assert not releasing.is_alive()
+    assert storage.exists(name)
+
+
+@pytest.mark.django_db
+def test_image_sizes_fall_back_to_original(
+    author, storage, settings, monkeypatch
+):
+    monkeypatch.setattr(signals, 'schedule_derivatives', lambda recipe: None)
+    settings.RECIPE_IMAGE_WIDTHS = [320, 640, 1280]
+    name = storage.save('recipes/images/a.png', png(800, 400))
+    recipe = make_recipe(author, name)
+    original = {'default': recipe.image.url}
+    field = ImageSizesField()
+    assert field.to_representation(recipe) == {
+        '320': original, '640': original, '1280': original
+    }
+
+    build_derivatives(recipe.pk, name)
+    recipe.refresh_from_db()
+    sizes = field.to_representation(recipe)
+    assert sizes['1280'] == original
+    for width in ('320', '640'):
+        assert sizes[width]['default'] != original['default']
+        path = sizes[width]['default'][len(settings.MEDIA_URL):]
+        with Image.open(storage.open(path)) as image:
+            assert image.width == int(width)
+
+    recipe.image = storage.save('recipes/images/b.png', png(900, 400))
+    recipe.save()
+    assert field.to_representation(recipe) == {
+        '320': {'default': recipe.image.url},
+        '640': {'default': recipe.image.url},
+        '1280': {'default': recipe.image.url}
+    }
@@ -0,0 +1,122 @@
+import pytest
+from django.core.cache import cache
+
+from api.cache import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPE_INGREDIENTS_VERSION_KEY,
+    bump_namespace_version,
+    get_namespace_changes,
+    get_namespace_version
+)
+from api.indexes import IngredientPrefixIndex, PantryIndex
+from recipes.models import Ingredient, IngredientRecipe
+
+
+def names(items):
+    return [item['name'] for item in items]
+
+
+@pytest.mark.django_db
+def test_ingredient_index_follows_version_bumps(settings):
+    settings.SNAPSHOT_STAMP_TTL = 3600
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    index = IngredientPrefixIndex()
+    assert names(index.search('сол')) == ['соль']
+    Ingredient.objects.filter(pk=salt.pk).update(name='солод')
+    assert names(index.search('сол')) == ['соль']
+    bump_namespace_version(INGREDIENTS_VERSION_KEY)
+    assert names(index.search('сол')) == ['солод']
+
+
+@pytest.mark.django_db
+def test_ingredient_index_notices_writes_without_signals(settings):
+    settings.SNAPSHOT_STAMP_TTL = 0
+    index = IngredientPrefixIndex()
+    assert index.search('соль') == []
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='соль', measurement_unit='г')]
+    )
+    assert names(index.search('соль')) == ['соль']
+
+
+def fail_build():
+    raise AssertionError('the pantry index was rebuilt')
+
+
+@pytest.mark.django_db
+def test_pantry_index_applies_recipe_deltas(
+    author, ingredients, make_recipes, monkeypatch,
+    django_capture_on_commit_callbacks
+):
+    first, second = make_recipes(author, 2)
+    index = PantryIndex()
+    at_hand = [ingredient.id for ingredient in ingredients[:5]]
+    assert dict(index.search(at_hand, 0.5)) == {first.id: 1.0, second.id: 0.8}
+    monkeypatch.setattr(index, 'build', fail_build)
+    with django_capture_on_commit_callbacks(execute=True):
+        IngredientRecipe.objects.filter(
+            recipe=first, ingredient=ingredients[0]
+        ).delete()
+        IngredientRecipe.objects.create(
+            recipe=second, ingredient=ingredients[0], amount=1
+        )
+    with django_capture_on_commit_callbacks(execute=True):
+        third, = make_recipes(author, 1)
+        IngredientRecipe.objects.create(
+            recipe=third, ingredient=ingredients[19], amount=1
+        )
+    with django_capture_on_commit_callbacks(execute=True):
+        IngredientRecipe.objects.filter(recipe=second).delete()
+    assert dict(index.search(at_hand, 0.5)) == {
+        first.id: 1.0, third.id: 5 / 6
+    }
+
+
+@pytest.mark.django_db
+def test_pantry_index_rebuilds_after_journal_gap(
+    author, ingredients, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    index = PantryIndex()
+    at_hand = [ingredient.id for ingredient in ingredients[:5]]
+    assert dict(index.search(at_hand, 1)) == {recipe.id: 1.0}
+    IngredientRecipe.objects.filter(
+        recipe=recipe, ingredient=ingredients[0]
+    ).update(ingredient=ingredients[10])
+    bump_namespace_version(RECIPE_INGREDIENTS_VERSION_KEY)
+    assert index.search(at_hand, 1) == []
+    assert dict(index.search(at_hand, 0.8)) == {recipe.id: 0.8}
+
+
+@pytest.mark.django_db
+def test_pantry_index_rebuilds_when_version_jumps(
+    author, ingredients, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    index = PantryIndex()
+    at_hand = [ingredient.id for ingredient in ingredients[:5]]
+    assert dict(index.search(at_hand, 1)) == {recipe.id: 1.0}
+    IngredientRecipe.objects.filter(recipe=recipe).delete()
+    cache.set(
+        RECIPE_INGREDIENTS_VERSION_KEY,
+        get_namespace_version(RECIPE_INGREDIENTS_VERSION_KEY) + 10 ** 9,
+        None
+    )
+    assert index.search(at_hand, 0) == []
+
+
+@pytest.mark.django_db
+def test_recipe_delete_logs_one_pantry_change(
+    author, make_recipes, django_capture_on_commit_callbacks
+):
+    recipe, = make_recipes(author, 1)
+    recipe_id = recipe.id
+    version = get_namespace_version(RECIPE_INGREDIENTS_VERSION_KEY)
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.delete()
+    assert get_namespace_version(RECIPE_INGREDIENTS_VERSION_KEY) == (
+        version + 1
+    )
+    assert get_namespace_changes(
+        RECIPE_INGREDIENTS_VERSION_KEY, version, version + 1, 10
+    ) == [[recipe_id]]
@@ -0,0 +1,51 @@
+import gzip
+import json
+
+import pytest
+
+from recipes.models import Ingredient
+
+URL = '/api/ingredients/'
+
+
+@pytest.fixture
+def salt(db):
+    return Ingredient.objects.create(name='соль', measurement_unit='г')
+
+
+@pytest.mark.parametrize('header, encodings', (
+    ('gzip', {'gzip'}),
+    ('gzip;q=0.5, identity', {'gzip'}),
+    ('gzip;q=0', {None}),
+    ('gzip;q=0.0', {None}),
+    ('gzip; q=0.000, identity', {None}),
+    ('*', {'br', 'gzip'}),
+    ('*, gzip;q=0', {'br', None}),
+    ('', {None}),
+))
+def test_catalogue_encoding(header, encodings, client, salt):
+    response = client.get(URL, HTTP_ACCEPT_ENCODING=header)
+    assert response.status_code == 200
+    encoding = response.get('Content-Encoding')
+    assert encoding in encodings
+    if encoding == 'br':
+        return
+    body = gzip.decompress(response.content) if encoding else response.content
+    assert json.loads(body)[0]['name'] == 'соль'
+
+
+@pytest.mark.django_db
+def test_catalogue_version_follows_writes_without_signals(settings, client):
+    settings.SNAPSHOT_STAMP_TTL = 0
+    version = client.get(URL + 'version/').data['version']
+    response = client.get(URL, {'v': version})
+    assert response['Cache-Control'] == 'public, max-age=31536000, immutable'
+    Ingredient.objects.bulk_create(
+        [Ingredient(name='перец', measurement_unit='г')]
+    )
+    response = client.get(URL, {'v': version})
+    assert response['X-Catalogue-Version'] != version
+    assert response['Cache-Control'] == 'no-cache'
+    assert [item['name'] for item in json.loads(response.content)] == [
+        'перец'
+    ]
@@ -0,0 +1,57 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+
+
+@pytest.mark.django_db
+def test_cursor_pages_cover_all_recipes_without_count(
+    client, author, make_recipes
+):
+    recipes = make_recipes(author, 7)
+    seen = []
+    response = client.get(URL, {'pagination': 'cursor', 'limit': 3})
+    while True:
+        assert 'count' not in response.data
+        seen.extend(item['id'] for item in response.data['results'])
+        if response.data['next'] is None:
+            break
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(response.data['next'])
+        assert not any(
+            'COUNT(' in query['sql'] for query in context.captured_queries
+        )
+        make_recipes(author, 1)
+    assert seen == [recipe.id for recipe in recipes[::-1]]
+
+
+@pytest.mark.django_db
+def test_page_number_mode_is_the_default(client, author, make_recipes):
+    recipes = make_recipes(author, 5)
+    response = client.get(URL, {'limit': 2, 'page': 2})
+    assert response.data['count'] == 5
+    assert [item['id'] for item in response.data['results']] == [
+        recipe.id for recipe in recipes[::-1][2:4]
+    ]
+
+
+@pytest.mark.django_db
+def test_search_keeps_relevance_in_cursor_mode(client, author):
+    def make_recipe(name, text):
+        return Recipe.objects.create(
+            author=author,
+            name=name,
+            text=text,
+            cooking_time=10,
+            image='recipes/images/recipe.png'
+        )
+    in_name = make_recipe('Борщ', 'Свёкла')
+    in_text = make_recipe('Суп', 'Почти борщ')
+    response = client.get(URL, {'search': 'борщ', 'pagination': 'cursor'})
+    assert response.status_code == 200
+    assert [item['id'] for item in response.data['results']] == [
+        in_name.id, in_text.id
+    ]
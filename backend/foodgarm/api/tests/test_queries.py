@@ -0,0 +1,216 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart
+)
+from users.models import Follow, User
+
+
+def count_queries(client, url, params):
+    """Number of queries of one request made with a cold cache."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, params)
+    assert response.status_code == 200, response.data
+    return response, len(context)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('authenticated', (False, True))
+def test_recipe_list_queries_do_not_grow_with_page_size(
+    authenticated, client, user_client, user, author, make_recipes
+):
+    recipes = make_recipes(author, 50)
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    client = user_client if authenticated else client
+    small, small_count = count_queries(client, '/api/recipes/', {'limit': 6})
+    large, large_count = count_queries(client, '/api/recipes/', {'limit': 50})
+    assert len(small.data['results']) == 6
+    assert len(large.data['results']) == 50
+    assert small_count == large_count
+
+
+@pytest.mark.django_db
+def test_recipe_list_user_flags(user_client, user, author, make_recipes):
+    recipes = make_recipes(author, 3)
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[1])
+    response = user_client.get('/api/recipes/')
+    flags = {
+        recipe['id']: (recipe['is_favorited'], recipe['is_in_shopping_cart'])
+        for recipe in response.data['results']
+    }
+    assert flags == {
+        recipes[0].id: (True, False),
+        recipes[1].id: (False, True),
+        recipes[2].id: (False, False),
+    }
+    favorited = user_client.get('/api/recipes/', {'is_favorited': 1})
+    assert [
+        recipe['id'] for recipe in favorited.data['results']
+    ] == [recipes[0].id]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('authenticated', (False, True))
+def test_user_list_queries_do_not_grow_with_page_size(
+    authenticated, client, user_client, user
+):
+    User.objects.bulk_create(
+        User(
+            username=f'author{n}',
+            email=f'author{n}@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        for n in range(100)
+    )
+    authors = list(User.objects.exclude(pk=user.pk).order_by('id'))
+    for author in authors[::3]:
+        Follow.objects.create(user=user, author=author)
+    client = user_client if authenticated else client
+    small, small_count = count_queries(client, '/api/users/', {'limit': 10})
+    large, large_count = count_queries(client, '/api/users/', {'limit': 100})
+    assert len(small.data['results']) == 10
+    assert len(large.data['results']) == 100
+    assert small_count == large_count
+    following = {author.id for author in authors[::3]}
+    assert all(
+        item['is_subscribed'] == (authenticated and item['id'] in following)
+        for item in large.data['results']
+    )
+
+
+@pytest.mark.django_db
+def test_recipe_update_queries_do_not_grow_with_ingredients(author, tags):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {n}', measurement_unit='г')
+        for n in range(40)
+    )
+    ingredients = list(Ingredient.objects.order_by('id'))
+    client = APIClient()
+    client.force_authenticate(author)
+    counts = {}
+    for size in (5, 40):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {size}',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png'
+        )
+        recipe.tags.set(tags[:2])
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients[:size]
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = client.patch(f'/api/recipes/{recipe.id}/', {
+                'name': f'Новый рецепт {size}',
+                'tags': [tag.id for tag in tags[:2]],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 2}
+                    for ingredient in ingredients[:size]
+                ],
+            }, format='json')
+        counts[size] = len(context)
+        assert response.status_code == 200, response.data
+        assert len(response.data['ingredients']) == size
+    assert counts[5] == counts[40]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('authenticated', (False, True))
+def test_bootstrap_matches_endpoints_with_shared_prefetch(
+    authenticated, client, user_client, user, author, make_recipes
+):
+    recipes = make_recipes(author, 50)
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    Follow.objects.create(user=user, author=author)
+    client = user_client if authenticated else client
+    small, small_count = count_queries(client, '/api/bootstrap/', {'limit': 6})
+    large, large_count = count_queries(
+        client, '/api/bootstrap/', {'limit': 50}
+    )
+    assert small_count == large_count
+    assert large.data['recipes'] == client.get(
+        '/api/recipes/', {'limit': 50}
+    ).data
+    assert large.data['tags'] == client.get('/api/tags/').data
+    if authenticated:
+        assert large.data['user'] == client.get('/api/users/me/').data
+    else:
+        assert large.data['user'] is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('limit', (None, 3))
+def test_latest_by_author_returns_top_recipes_per_author(
+    author, make_user, make_recipes, limit
+):
+    other, idle = make_user('other'), make_user('idle')
+    recipes = {
+        author.id: make_recipes(author, 5),
+        other.id: make_recipes(other, 2),
+        idle.id: [],
+    }
+    with CaptureQueriesContext(connection) as context:
+        latest = Recipe.objects.latest_by_author(
+            [author.id, other.id, idle.id],
+            limit,
+            fields=('id', 'name', 'cooking_time')
+        )
+        previews = {
+            author_id: [(recipe.id, recipe.name) for recipe in rows]
+            for author_id, rows in latest.items()
+        }
+    assert len(context) == 1
+    sql = context.captured_queries[0]['sql']
+    assert '*' not in sql and 'search_vector' not in sql
+    assert previews == {
+        author_id: [
+            (recipe.id, recipe.name) for recipe in rows[::-1][:limit]
+        ]
+        for author_id, rows in recipes.items()
+    }
+
+
+@pytest.mark.django_db
+def test_subscriptions_queries_do_not_grow_with_page_size(
+    user_client, user, make_recipes
+):
+    authors = User.objects.bulk_create(
+        User(
+            username=f'author{n}',
+            email=f'author{n}@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        for n in range(12)
+    )
+    for author in User.objects.filter(username__startswith='author'):
+        Follow.objects.create(user=user, author=author)
+        make_recipes(author, 3)
+    url = '/api/users/subscriptions/'
+    small, small_count = count_queries(
+        user_client, url, {'limit': 2, 'recipes_limit': 2}
+    )
+    large, large_count = count_queries(
+        user_client, url, {'limit': 12, 'recipes_limit': 2}
+    )
+    assert len(large.data['results']) == len(authors)
+    assert small_count == large_count
+    assert all(
+        len(item['recipes']) == 2 and item['recipes_count'] == 3
+        and item['is_subscribed']
+        for item in large.data['results']
+    )
@@ -0,0 +1,169 @@
+import base64
+import io
+import os
+import tracemalloc
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.cache import get_recipe_list_stats
+from api.serializers import Base64ImageField
+from recipes.models import IngredientRecipe, SimilarityState
+from users.models import User
+
+
+def png_data_uri(side):
+    """Data URI of a noisy PNG, which does not compress."""
+    buffer = io.BytesIO()
+    Image.frombytes(
+        'RGB', (side, side), os.urandom(side * side * 3)
+    ).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.mark.django_db
+def test_ingredient_only_update_refreshes_cached_recipe(
+    client, author_client, author, make_recipes, ingredients,
+    django_capture_on_commit_callbacks
+):
+    recipe = make_recipes(author, 1, ingredients_count=2)[0]
+    url = f'/api/recipes/{recipe.id}/'
+    cached = client.get(url)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = author_client.patch(url, {
+            'ingredients': [
+                {'id': ingredients[0].id, 'amount': 7},
+                {'id': ingredients[1].id, 'amount': 2},
+                {'id': ingredients[10].id, 'amount': 3},
+            ]
+        }, format='json')
+    assert response.status_code == 200, response.data
+    fresh = client.get(url, HTTP_IF_NONE_MATCH=cached['ETag'])
+    assert fresh.status_code == 200
+    assert [
+        (ingredient['id'], ingredient['amount'])
+        for ingredient in fresh.data['ingredients']
+    ] == [
+        (ingredients[0].id, 7),
+        (ingredients[1].id, 2),
+        (ingredients[10].id, 3),
+    ]
+
+
+def test_base64_image_is_not_read_into_memory():
+    field = Base64ImageField()
+    field.to_internal_value(png_data_uri(8)).close()
+    data = png_data_uri(1000)
+    tracemalloc.start()
+    image = field.to_internal_value(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    path = image.temporary_file_path()
+    assert os.path.getsize(path) == image.size > 2 * 1024 * 1024
+    assert peak < 1024 * 1024
+    image.close()
+    assert not os.path.exists(path)
+
+
+@pytest.mark.django_db
+def test_pantry_filters_ranked_recipes_in_chunks(
+    client, author, make_user, ingredients, make_recipes, settings
+):
+    settings.PANTRY_FILTER_CHUNK_SIZE = 2
+    own = make_recipes(author, 4)
+    make_recipes(make_user('other'), 3)
+    response = client.get('/api/recipes/pantry/', {
+        'ingredients': [ingredient.id for ingredient in ingredients[:8]],
+        'min_coverage': 0.5,
+        'author': author.id,
+        'limit': 3,
+    })
+    assert response.status_code == 200
+    assert response.data['count'] == 4
+    assert [item['id'] for item in response.data['results']] == [
+        recipe.id for recipe in reversed(own)
+    ][:3]
+
+
+@pytest.mark.django_db
+def test_anonymous_list_cache_follows_author_changes(
+    client, author, make_recipes, django_capture_on_commit_callbacks
+):
+    make_recipes(author, 2)
+
+    def author_names():
+        response = client.get('/api/recipes/')
+        return {
+            item['author']['first_name'] for item in response.data['results']
+        }
+    assert author_names() == {'Имя'}
+    User.objects.filter(pk=author.pk).update(first_name='Без сигналов')
+    assert author_names() == {'Имя'}
+    with django_capture_on_commit_callbacks(execute=True):
+        author.first_name = 'Новое'
+        author.save()
+    assert author_names() == {'Новое'}
+    output = io.StringIO()
+    call_command('recipe_cache_stats', '--reset', stdout=output)
+    assert 'hits: 1, misses: 2' in output.getvalue()
+    assert get_recipe_list_stats() == {'hits': 0, 'misses': 0}
+
+
+def compute_similar_recipes(*args):
+    out = StringIO()
+    call_command('compute_similar_recipes', '--workers', '1', *args,
+                 stdout=out)
+    return out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_similar_recipes_recompute_only_changed(
+    settings, author, ingredients, make_recipes
+):
+    settings.SIMILAR_RECIPES_COUNT = 2
+    recipes = make_recipes(author, 6)
+    assert 'Changed: 6, deleted: 0' in compute_similar_recipes('--full')
+    states = dict(
+        SimilarityState.objects.values_list('recipe_id', 'fingerprint')
+    )
+    assert states.keys() == {recipe.pk for recipe in recipes}
+
+    assert 'Changed: 0, deleted: 0, recomputed: 0' in (
+        compute_similar_recipes()
+    )
+
+    changed = recipes[0]
+    IngredientRecipe.objects.filter(recipe=changed).delete()
+    IngredientRecipe.objects.create(
+        recipe=changed, ingredient=ingredients[-1], amount=1
+    )
+    assert 'Changed: 1, deleted: 0' in compute_similar_recipes()
+    updated = dict(
+        SimilarityState.objects.values_list('recipe_id', 'fingerprint')
+    )
+    assert updated[changed.pk] != states[changed.pk]
+    assert {
+        recipe_id: fingerprint for recipe_id, fingerprint in updated.items()
+        if recipe_id != changed.pk
+    } == {
+        recipe_id: fingerprint for recipe_id, fingerprint in states.items()
+        if recipe_id != changed.pk
+    }
+
+    deleted_id = recipes[1].pk
+    recipes[1].delete()
+    assert 'Changed: 0, deleted: 1' in compute_similar_recipes()
+    assert not SimilarityState.objects.filter(recipe_id=deleted_id).exists()
+    assert SimilarityState.objects.count() == 5
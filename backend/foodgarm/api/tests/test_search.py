@@ -0,0 +1,68 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe
+from recipes.search import SQLITE_TRIGGERS, restore_search_triggers
+
+
+def make_recipe(author, name, text):
+    return Recipe.objects.create(
+        author=author,
+        name=name,
+        text=text,
+        cooking_time=10,
+        image='recipes/images/recipe.png'
+    )
+
+
+def search_ids(client, query):
+    response = client.get('/api/recipes/', {'search': query})
+    assert response.status_code == 200
+    return [item['id'] for item in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_search_ranks_name_above_text(client, author):
+    in_text = make_recipe(author, 'Суп', 'Классический борщ со сметаной')
+    in_name = make_recipe(author, 'Борщ', 'Свёкла, капуста, картофель')
+    make_recipe(author, 'Блины', 'Мука, молоко, яйца')
+    assert search_ids(client, 'борщ') == [in_name.id, in_text.id]
+
+
+@pytest.mark.django_db
+def test_search_follows_updates(client, author):
+    recipe = make_recipe(author, 'Борщ', 'Свёкла')
+    Recipe.objects.filter(pk=recipe.pk).update(name='Щи')
+    assert search_ids(client, 'борщ') == []
+    assert search_ids(client, 'щи') == [recipe.id]
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='tsvector is Postgres only'
+)
+@pytest.mark.django_db
+def test_postgres_search_uses_generated_vector(client, author):
+    recipe = make_recipe(author, 'Пельмени', 'Домашние пельмени с бульоном')
+    with CaptureQueriesContext(connection) as context:
+        assert search_ids(client, 'пельменей') == [recipe.id]
+    assert any(
+        'search_vector @@ websearch_to_tsquery' in query['sql']
+        for query in context.captured_queries
+    )
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'sqlite', reason='FTS5 triggers are SQLite only'
+)
+@pytest.mark.django_db
+def test_sqlite_search_triggers_are_restored(author):
+    with connection.cursor() as cursor:
+        for name in SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER {name}')
+    recipe = make_recipe(author, 'Борщ', 'Свёкла')
+    assert not Recipe.objects.search('борщ').exists()
+    restore_search_triggers(sender=None, using=connection.alias)
+    assert list(Recipe.objects.search('борщ')) == [recipe]
+    Recipe.objects.filter(pk=recipe.pk).update(name='Щи')
+    assert list(Recipe.objects.search('щи')) == [recipe]
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('format', ('txt', 'csv', 'json', 'pdf'))
+def test_shopping_list_errors_are_json(format, client):
+    response = client.get(URL, {'format': format})
+    assert response.status_code == 401
+    assert response['Content-Type'] == 'application/json'
+    assert 'detail' in json.loads(response.content)
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'amount'
+    ))
+
+
+def expected_list(*recipes):
+    totals = {}
+    for ingredient_id, amount in IngredientRecipe.objects.filter(
+        recipe__in=recipes
+    ).values_list('ingredient_id', 'amount'):
+        totals[ingredient_id] = totals.get(ingredient_id, 0) + amount
+    return totals
+
+
+@pytest.mark.django_db
+def test_shopping_list_follows_cart_changes(
+    user, user_client, author, make_recipes
+):
+    first, second = make_recipes(author, 2)
+    for recipe in (first, second):
+        user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    assert shopping_list(user) == expected_list(first, second)
+    user_client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+    assert shopping_list(user) == expected_list(second)
+    user_client.post(
+        '/api/recipes/shopping_cart/', {'recipes': [first.id]}, format='json'
+    )
+    assert shopping_list(user) == expected_list(first, second)
+    user_client.delete(
+        '/api/recipes/shopping_cart/',
+        {'recipes': [first.id, second.id]},
+        format='json'
+    )
+    assert shopping_list(user) == {}
+
+
+@pytest.mark.django_db
+def test_shopping_list_follows_ingredient_edits(
+    user, user_client, author, ingredients, make_recipes
+):
+    recipe, = make_recipes(author, 1)
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    author_client = APIClient()
+    author_client.force_authenticate(author)
+    response = author_client.patch(f'/api/recipes/{recipe.id}/', {
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+        'ingredients': [
+            {'id': ingredients[0].id, 'amount': 10},
+            {'id': ingredients[7].id, 'amount': 3},
+        ],
+    }, format='json')
+    assert response.status_code == 200, response.data
+    assert shopping_list(user) == {ingredients[0].id: 10, ingredients[7].id: 3}
+
+
+@pytest.mark.django_db
+def test_shopping_list_drops_deleted_recipe(
+    user, make_user, author, make_recipes
+):
+    first, second = make_recipes(author, 2)
+    other = make_user('other')
+    for cart_user in (user, other):
+        for recipe in (first, second):
+            ShoppingCart.objects.create(user=cart_user, recipe=recipe)
+            ShoppingListItem.objects.add_recipes([cart_user.id], [recipe.id])
+    first.delete()
+    assert shopping_list(user) == expected_list(second)
+    assert shopping_list(other) == expected_list(second)
+
+
+@pytest.mark.django_db
+def test_rebuild_shopping_lists_repairs_drift(
+    user, make_user, author, make_recipes
+):
+    first, second = make_recipes(author, 2)
+    other = make_user('other')
+    ShoppingCart.objects.create(user=user, recipe=first)
+    ShoppingCart.objects.create(user=user, recipe=second)
+    ShoppingCart.objects.create(user=other, recipe=second)
+    ShoppingListItem.objects.create(
+        user=other, ingredient_id=first.ingredients.first().id, amount=100
+    )
+    call_command('rebuild_shopping_lists', '--dry-run')
+    assert shopping_list(user) == {}
+    call_command('rebuild_shopping_lists')
+    assert shopping_list(user) == expected_list(first, second)
+    assert shopping_list(other) == expected_list(second)
@@ -0,0 +1,90 @@
+import pytest
+
+from api.cache import TAGS_VERSION_KEY, bump_namespace_version
+from recipes.models import Recipe, Tag, get_tags_mask
+
+TAG_IDS = (5, 40, 63, 64, 100)
+RECIPE_TAGS = ((5,), (40,), (5, 63), (63, 64), (100,), (), (5, 40, 100))
+
+
+@pytest.fixture
+def tagged_recipes(author):
+    tags = {
+        tag_id: Tag.objects.create(
+            id=tag_id,
+            name=f'Тег {tag_id}',
+            color=f'#{tag_id:06d}',
+            slug=f'tag{tag_id}'
+        )
+        for tag_id in TAG_IDS
+    }
+    recipes = []
+    for n, tag_ids in enumerate(RECIPE_TAGS):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {n}',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.png'
+        )
+        recipe.tags.set([tags[tag_id] for tag_id in tag_ids])
+        recipes.append(recipe)
+    return recipes
+
+
+def mask(recipe):
+    return Recipe.objects.values_list('tags_mask', flat=True).get(
+        pk=recipe.pk
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('tag_ids', (
+    (5,), (63,), (5, 40), (40, 63), (64,), (5, 100), (63, 64, 100)
+))
+def test_tag_filter_matches_join(client, tagged_recipes, tag_ids):
+    slugs = [f'tag{tag_id}' for tag_id in tag_ids]
+    response = client.get('/api/recipes/', {'tags': slugs, 'limit': 100})
+    assert response.status_code == 200
+    assert sorted(item['id'] for item in response.data['results']) == sorted(
+        Recipe.objects.filter(tags__slug__in=slugs).distinct().values_list(
+            'id', flat=True
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_tags_mask_follows_tag_changes(tagged_recipes):
+    recipe = tagged_recipes[0]
+    tag5, tag40, tag63 = (Tag.objects.get(pk=pk) for pk in (5, 40, 63))
+    recipe.tags.set([tag40, tag63])
+    assert mask(recipe) == get_tags_mask([40, 63])
+    recipe.tags.remove(tag63)
+    assert mask(recipe) == get_tags_mask([40])
+    tag5.recipe_set.add(recipe)
+    assert mask(recipe) == get_tags_mask([5, 40])
+    tag5.recipe_set.clear()
+    assert mask(recipe) == get_tags_mask([40])
+    assert mask(tagged_recipes[6]) == get_tags_mask([40])
+    tag40.delete()
+    assert mask(recipe) == 0
+    assert mask(tagged_recipes[6]) == 0
+    assert mask(tagged_recipes[2]) == get_tags_mask([63])
+
+
+@pytest.mark.django_db
+def test_not_modified_is_decided_by_etag_only(client, tags):
+    first = client.get('/api/tags/')
+    assert first.status_code == 200
+    assert client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag']
+    ).status_code == 304
+    bump_namespace_version(TAGS_VERSION_KEY)
+    changed = client.get(
+        '/api/tags/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+    )
+    assert changed.status_code == 200
+    assert changed['ETag'] != first['ETag']
+    assert client.get(
+        '/api/tags/', HTTP_IF_NONE_MATCH=changed['ETag']
+    ).status_code == 304
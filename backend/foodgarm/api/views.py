@@ -1,8 +1,18 @@
-from django.db.models import Sum
-from django.http import Http404
+from functools import partial
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser.views import UserViewSet as DjoserUserViewSet
 from django.shortcuts import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from rest_framework.generics import get_object_or_404
 from rest_framework import status, viewsets, serializers
 from rest_framework.decorators import action
@@ -13,35 +23,100 @@ from rest_framework.generics import ListAPIView
 
 from recipes.models import (
     Favorite, Ingredient, Recipe,
-    ShoppingCart, Tag, IngredientRecipe
+    ShoppingCart, ShoppingListItem, SimilarRecipe, Tag
 )
+from recipes.timeline import feed_recipe_ids
 from users.models import User, Follow
+from .cache import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPE_LIST_VERSION_KEY,
+    TAGS_VERSION_KEY,
+    bump_namespace_version,
+    get_recipe_fragments,
+    get_recipe_list,
+    set_recipe_fragments,
+    set_recipe_list,
+    user_version_key
+)
 from .filters import RecipeFilter, IngredientFilter
+from .indexes import ingredient_catalogue, ingredient_index, pantry_index
+from .mixins import ConditionalGetMixin
+from .pagination import (
+    CastomPagination,
+    CursorSwitchPagination,
+    FeedPagination
+)
 from .permissions import IsAdminAuthorOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (
     FavoriteSerializer,
     IngredientSerializer,
+    PantrySerializer,
+    RecipeIdsSerializer,
     RecipeNotSafeMetodSerialaizer,
     RecipeSerializer,
     ShoppingCartSerializer,
     TagSerialiser,
     UserFollowInfoSerializer,
-    UserFollowSerializer
+    UserFollowSerializer,
+    UserGetSerializer
 )
+from .shopping_list import (
+    SHOPPING_LIST_STREAMS,
+    shopping_list_rows,
+    write_pdf
+)
+
+
+def lock_user(user):
+    """Serialize favorite and shopping cart changes of one user.
 
+    A retried or double-clicked request waits for the first one and then
+    sees its rows, so counters and the shopping list change only once.
+    """
+    User.objects.select_for_update().only('id').get(pk=user.pk)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+def accepted_encodings(header):
+    """Content codings of an Accept-Encoding header with a non-zero q.
+
+    A wildcard accepts every coding that is not refused explicitly.
+    """
+    qualities = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    accepted = {coding for coding, quality in qualities.items() if quality}
+    if '*' in accepted:
+        accepted.update(
+            coding for coding in ('br', 'gzip') if coding not in qualities
+        )
+    return accepted
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Getting information about tags."""
 
+    version_keys = (TAGS_VERSION_KEY,)
     queryset = Tag.objects.all()
     serializer_class = TagSerialiser
     permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Getting information about ingredients."""
 
+    version_keys = (INGREDIENTS_VERSION_KEY,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
@@ -49,21 +124,154 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        if (
+            not request.query_params.get('name')
+            and request.accepted_renderer.format == 'json'
+        ):
+            return self.catalogue(request)
+        return self.conditional(
+            self.list_ingredients, request, *args, **kwargs
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def catalogue(self, request):
+        """Full list from memory, precompressed and tagged by content."""
+        version, bodies = ingredient_catalogue.get()
+        accepted = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        encoding = next(
+            (coding for coding in ('br', 'gzip')
+             if coding in accepted and coding in bodies),
+            'identity'
+        )
+        etag = (
+            f'"{version}"' if encoding == 'identity'
+            else f'"{version}-{encoding}"'
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                bodies[encoding], content_type='application/json'
+            )
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['X-Catalogue-Version'] = version
+        response['Cache-Control'] = (
+            'public, max-age=31536000, immutable'
+            if request.query_params.get('v') == version
+            else 'no-cache'
+        )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    @action(detail=False, methods=['get'], url_path='version')
+    def catalogue_version(self, request):
+        return Response({'version': ingredient_catalogue.get()[0]})
+
+    def list_ingredients(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Working with recipes."""
 
-    queryset = Recipe.objects.all()
+    version_keys = (RECIPE_LIST_VERSION_KEY,)
+    per_user = True
     permission_classes = (IsAdminAuthorOrReadOnly, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = CursorSwitchPagination
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve', 'feed', 'similar', 'pantry'):
+            return queryset.with_author_subscription(self.request.user)
+        return queryset
+
+    def serialize_recipes(self, recipes):
+        """Cached shared fragments with the per-user fields merged in."""
+        keys, fragments = get_recipe_fragments(
+            [recipe.id for recipe in recipes]
+        )
+        missing = [
+            recipe.id for recipe in recipes if recipe.id not in fragments
+        ]
+        if missing:
+            fresh = {
+                fragment['id']: fragment
+                for fragment in RecipeSerializer(
+                    Recipe.objects.with_related(
+                        AnonymousUser()
+                    ).filter(id__in=missing),
+                    many=True,
+                    context={}
+                ).data
+            }
+            set_recipe_fragments(keys, fresh)
+            fragments.update(fresh)
+        build_uri = self.request.build_absolute_uri
+        data = []
+        for recipe in recipes:
+            fragment = fragments[recipe.id]
+            image = fragment['image']
+            sizes = fragment.get('image_sizes', {})
+            data.append({
+                **fragment,
+                'author': {
+                    **fragment['author'],
+                    'is_subscribed': recipe.author_is_subscribed
+                },
+                'is_favorited': recipe.is_favorited,
+                'is_in_shopping_cart': recipe.is_in_shopping_cart,
+                'image': image and build_uri(image),
+                'image_sizes': {
+                    width: {
+                        format: build_uri(url)
+                        for format, url in variants.items()
+                    }
+                    for width, variants in sizes.items()
+                }
+            })
+        return data
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.list_recipes, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            self.retrieve_recipe, request, *args, **kwargs
+        )
+
+    def list_recipes(self, request, *args, **kwargs):
+        if request.user.is_anonymous:
+            key, data = get_recipe_list(request)
+            if data is not None:
+                return Response(data)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.serialize_recipes(list(queryset)))
+        response = self.get_paginated_response(self.serialize_recipes(page))
+        if request.user.is_anonymous:
+            set_recipe_list(key, response.data)
+        return response
+
+    def retrieve_recipe(self, request, *args, **kwargs):
+        return Response(self.serialize_recipes([self.get_object()])[0])
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeSerializer
         return RecipeNotSafeMetodSerialaizer
 
-    def recipe_post_delite(self, request, pk, model, serialiser_class):
+    def recipe_post_delite(
+        self, request, pk, model, serialiser_class, counter
+    ):
         try:
             recipe = Recipe.objects.get(id=pk)
         except ObjectDoesNotExist:
@@ -80,21 +288,90 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 },
                 context={'request': request}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                lock_user(request.user)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: F(counter) + 1}
+                )
+                if model is ShoppingCart:
+                    ShoppingListItem.objects.add_recipes(
+                        [request.user.id], [recipe.id]
+                    )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            if not model.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).exists():
-                return Response(status=status.HTTP_400_BAD_REQUEST)
-            model.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).delete()
+            with transaction.atomic():
+                lock_user(request.user)
+                deleted, _ = model.objects.filter(
+                    user=request.user,
+                    recipe=recipe
+                ).delete()
+                if not deleted:
+                    return Response(status=status.HTTP_400_BAD_REQUEST)
+                Recipe.objects.filter(id=recipe.id).update(
+                    **{counter: Greatest(F(counter) - deleted, 0)}
+                )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def recipes_bulk_post_delete(self, request, model, counter):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        found = set(
+            Recipe.objects.filter(
+                id__in=recipe_ids
+            ).values_list('id', flat=True)
+        )
+        sign = 1 if request.method == 'POST' else -1
+        if sign > 0:
+            statuses = ('added', 'already_added')
+        else:
+            statuses = ('removed', 'not_in_list')
+        with transaction.atomic():
+            lock_user(request.user)
+            present = set(
+                model.objects.filter(
+                    user=request.user,
+                    recipe_id__in=found
+                ).values_list('recipe_id', flat=True)
+            )
+            changed = found - present if sign > 0 else present
+            if sign > 0:
+                model.objects.bulk_create(
+                    (model(user=request.user, recipe_id=recipe_id)
+                     for recipe_id in changed),
+                    ignore_conflicts=True
+                )
+            else:
+                model.objects.filter(
+                    user=request.user,
+                    recipe_id__in=changed
+                ).delete()
+            Recipe.objects.filter(id__in=changed).update(
+                **{counter: Greatest(F(counter) + sign, 0)}
+            )
+            # Removals reach the shopping list through the pre_delete
+            # handler of ShoppingCart, which also covers cascades.
+            if model is ShoppingCart and sign > 0:
+                ShoppingListItem.objects.add_recipes(
+                    [request.user.id], changed
+                )
+            transaction.on_commit(lambda: bump_namespace_version(
+                user_version_key(request.user.id)
+            ))
+        return Response([
+            {
+                'id': recipe_id,
+                'status': (
+                    'not_found' if recipe_id not in found
+                    else statuses[0] if recipe_id in changed
+                    else statuses[1]
+                )
+            }
+            for recipe_id in recipe_ids
+        ])
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -105,7 +382,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request,
             pk,
             Favorite,
-            FavoriteSerializer
+            FavoriteSerializer,
+            'favorites_count'
         )
 
     @action(
@@ -118,36 +396,163 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request,
             pk,
             ShoppingCart,
-            ShoppingCartSerializer
+            ShoppingCartSerializer,
+            'in_carts_count'
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='favorite',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        return self.recipes_bulk_post_delete(
+            request,
+            Favorite,
+            'favorites_count'
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        return self.recipes_bulk_post_delete(
+            request,
+            ShoppingCart,
+            'in_carts_count'
+        )
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Precomputed recipes with the most similar ingredients."""
+        get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        ids = list(SimilarRecipe.objects.filter(recipe_id=pk).order_by(
+            '-score'
+        ).values_list('similar_id', flat=True)[
+            :settings.SIMILAR_RECIPES_COUNT
+        ])
+        position = {recipe_id: index for index, recipe_id in enumerate(ids)}
+        recipes = sorted(
+            self.get_queryset().filter(id__in=ids),
+            key=lambda recipe: position[recipe.id]
+        )
+        return Response(self.serialize_recipes(recipes))
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated, ]
     )
+    def feed(self, request):
+        """Recipes of followed authors, newest first."""
+        paginator = FeedPagination()
+        ids = paginator.paginate_ids(
+            partial(feed_recipe_ids, request.user), request
+        )
+        return paginator.get_paginated_response(
+            self.serialize_recipes(self.get_queryset().filter(id__in=ids))
+        )
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        """Recipes that can be cooked from the given ingredients."""
+        serializer = PantrySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        coverage = dict(pantry_index.search(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['min_coverage']
+        ))
+        queryset = self.filter_queryset(self.get_queryset())
+        ranked = list(coverage)
+        size = settings.PANTRY_FILTER_CHUNK_SIZE
+        allowed = set()
+        for start in range(0, len(ranked), size):
+            allowed.update(queryset.filter(
+                id__in=ranked[start:start + size]
+            ).values_list('id', flat=True))
+        paginator = CastomPagination()
+        ids = paginator.paginate_queryset(
+            [recipe_id for recipe_id in ranked if recipe_id in allowed],
+            request,
+            view=self
+        )
+        position = {recipe_id: index for index, recipe_id in enumerate(ids)}
+        recipes = sorted(
+            self.get_queryset().filter(id__in=ids),
+            key=lambda recipe: position[recipe.id]
+        )
+        return paginator.get_paginated_response([
+            {**item, 'coverage': round(coverage[item['id']], 4)}
+            for item in self.serialize_recipes(recipes)
+        ])
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, ],
+        renderer_classes=SHOPPING_LIST_RENDERERS
+    )
     def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_carts__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(ingredient_amount=Sum('amount'))
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(
-                ingredient.get('ingredient__name'),
-                ingredient.get('ingredient_amount'),
-                ingredient.get('ingredient__measurement_unit')
+        renderer = request.accepted_renderer
+        filename = f'shopping_list.{renderer.format}'
+        rows = shopping_list_rows(request.user)
+        if renderer.format == 'pdf':
+            return FileResponse(
+                write_pdf(rows),
+                filename=filename,
+                content_type=renderer.media_type
             )
-        ) for ingredient in ingredients]
-        response = HttpResponse(
-            'Ваш список покупок:\n' + '\n'.join(file_list),
-            content_type='text/plain'
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_STREAMS[renderer.format](rows),
+            content_type=f'{renderer.media_type}; charset=utf-8'
         )
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
+class BootstrapView(APIView):
+    """Current user, tags and the first recipe page in one response."""
+
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        recipes_view = RecipeViewSet(
+            request=request,
+            args=(),
+            kwargs={},
+            format_kwarg=self.format_kwarg,
+            action='list'
+        )
+        return Response({
+            'user': (
+                UserGetSerializer(
+                    request.user, context={'request': request}
+                ).data
+                if request.user.is_authenticated else None
+            ),
+            'tags': TagSerialiser(Tag.objects.all(), many=True).data,
+            'recipes': self.with_recipes_links(
+                recipes_view.list_recipes(request).data
+            ),
+        })
+
+    def with_recipes_links(self, page):
+        """Point pagination links at /api/recipes/ instead of here."""
+        recipes_path = reverse('recipes-list')
+        for link in ('next', 'previous'):
+            if page.get(link):
+                page[link] = urlunsplit(
+                    urlsplit(page[link])._replace(path=recipes_path)
+                )
+        return page
+
+
 class UserFollowView(APIView):
     """Creating/deleting a subscription for a user."""
 
@@ -176,10 +581,34 @@ class UserFollowView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class UserViewSet(DjoserUserViewSet):
+    """Users with the subscription flag annotated in the same query."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.with_is_subscribed(
+                self.request.user
+            ).order_by('id')
+        return queryset
+
+
 class UserFollowGetView(ListAPIView):
     """Getting user subscriptions."""
 
     serializer_class = UserFollowInfoSerializer
+    pagination_class = CursorSwitchPagination
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        return User.objects.filter(
+            following__user=self.request.user
+        ).with_is_subscribed(self.request.user).with_recipes_count().order_by(
+            '-id'
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        UserFollowInfoSerializer.prefetch_recipes(page, request)
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
@@ -99,6 +99,56 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django_redis.cache.RedisCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://redis:6379/0'),
+    }
+}
+
+RECIPE_LIST_CACHE_TIMEOUT = int(os.getenv('RECIPE_LIST_CACHE_TIMEOUT', 300))
+
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+SNAPSHOT_STAMP_TTL = int(os.getenv('SNAPSHOT_STAMP_TTL', 10))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+PANTRY_MIN_COVERAGE = float(os.getenv('PANTRY_MIN_COVERAGE', 0.5))
+
+PANTRY_MAX_DELTA = int(os.getenv('PANTRY_MAX_DELTA', 1000))
+
+PANTRY_FILTER_CHUNK_SIZE = int(os.getenv('PANTRY_FILTER_CHUNK_SIZE', 1000))
+
+CHANGE_JOURNAL_TIMEOUT = int(os.getenv('CHANGE_JOURNAL_TIMEOUT', 60 * 60))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+RECIPE_IMAGE_WIDTHS = [
+    int(width)
+    for width in os.getenv('RECIPE_IMAGE_WIDTHS', '320,640,1280').split(',')
+]
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 200))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
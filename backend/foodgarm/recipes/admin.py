@@ -6,6 +6,7 @@ from .models import (
     Tag,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Favorite
 )
 
@@ -54,6 +55,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author',
         'favorites_count',
+        'in_carts_count',
     )
     list_filter = (
         'name',
@@ -63,9 +65,6 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-empty-'
     inlines = [IngredientRecipeInline]
 
-    def favorites_count(self, obj):
-        return obj.favorite_recipe.count()
-
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
@@ -85,3 +84,14 @@ class FavoriteAdmin(admin.ModelAdmin):
         'recipe',
     )
     empty_value_display = '-empty-'
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'ingredient',
+        'amount',
+    )
+    empty_value_display = '-empty-'
@@ -0,0 +1,28 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+executor = None
+
+
+def run(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Background task %s failed', function.__name__)
+    finally:
+        connections.close_all()
+
+
+def submit_on_commit(function, *args):
+    """Выполнить function(*args) в фоне после коммита транзакции."""
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_WORKERS,
+            thread_name_prefix='recipes'
+        )
+    transaction.on_commit(lambda: executor.submit(run, function, *args))
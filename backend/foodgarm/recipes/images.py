@@ -0,0 +1,103 @@
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .background import submit_on_commit
+from .models import Recipe
+from .storage import lock_name
+
+DERIVATIVES_DIR = 'recipes/images/sizes'
+
+
+def save_image(image, name, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format, quality=82, optimize=True)
+    return default_storage.save(
+        posixpath.join(DERIVATIVES_DIR, name),
+        ContentFile(buffer.getvalue())
+    )
+
+
+def make_derivatives(name):
+    """Уменьшенные копии картинки для каждой ширины из настроек.
+
+    Копии шире оригинала не создаются. Возвращает словарь, который
+    хранится в Recipe.image_derivatives.
+    """
+    with Recipe._meta.get_field('image').storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image = image.convert('RGBA' if alpha else 'RGB')
+    format, extension = ('PNG', 'png') if alpha else ('JPEG', 'jpg')
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    sizes = {}
+    for width in sorted(settings.RECIPE_IMAGE_WIDTHS):
+        if width >= image.width:
+            break
+        resized = image.resize(
+            (width, round(image.height * width / image.width)),
+            Image.LANCZOS
+        )
+        variants = {
+            'default': save_image(
+                resized, f'{stem}_{width}.{extension}', format
+            )
+        }
+        if features.check('webp'):
+            variants['webp'] = save_image(
+                resized, f'{stem}_{width}.webp', 'WEBP'
+            )
+        sizes[str(width)] = variants
+    return {'source': name, 'sizes': sizes}
+
+
+def delete_derivatives(derivatives):
+    for variants in derivatives.get('sizes', {}).values():
+        for name in variants.values():
+            default_storage.delete(name)
+
+
+def release_image(name):
+    """Удалить файл картинки, если на него не ссылается ни один рецепт.
+
+    Ссылки проверяются под блокировкой имени: транзакция, которая как раз
+    сохраняет рецепт с этим файлом, держит её до коммита.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        lock_name(name)
+        if not Recipe.objects.filter(image=name).exists():
+            Recipe._meta.get_field('image').storage.delete(name)
+
+
+def store_derivatives(recipe_id, derivatives):
+    """Сохранить копии, если картинка рецепта за это время не сменилась."""
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id,
+            image=derivatives['source']
+        ).first()
+        if recipe is None:
+            old = derivatives
+        else:
+            old = recipe.image_derivatives
+            recipe.image_derivatives = derivatives
+            recipe.save(update_fields=['image_derivatives'])
+    delete_derivatives(old)
+
+
+def build_derivatives(recipe_id, name):
+    store_derivatives(recipe_id, make_derivatives(name))
+
+
+def schedule_derivatives(recipe):
+    """Построить копии картинки в фоне после коммита транзакции."""
+    submit_on_commit(build_derivatives, recipe.pk, recipe.image.name)
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.images import make_derivatives, store_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Build resized copies of recipe images in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of worker processes.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild copies that are already up to date.'
+        )
+
+    def handle(self, *args, **options):
+        pending = [
+            (recipe_id, image)
+            for recipe_id, image, derivatives in Recipe.objects.exclude(
+                image=''
+            ).exclude(image__isnull=True).values_list(
+                'id', 'image', 'image_derivatives'
+            ).iterator()
+            if options['force'] or derivatives.get('source') != image
+        ]
+        connections.close_all()
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(make_derivatives, image): recipe_id
+                for recipe_id, image in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    store_derivatives(futures[future], future.result())
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'Recipe {futures[future]}: {error}')
+                else:
+                    built += 1
+        self.stdout.write(f'Built: {built}, failed: {failed}')
+        if built:
+            self.stdout.write(self.style.SUCCESS('Image derivatives built'))
@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, Min
+
+from recipes.models import Recipe, SimilarityState, SimilarRecipe
+from recipes.similarity import RecipeMatrix, init_worker, top_neighbours
+
+
+def chunks(items, size=1000):
+    items = list(items)
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def get_thresholds(matrix, count):
+    """Худшее сходство в сохранённых списках; 0, если список не полон."""
+    thresholds = np.zeros(matrix.size)
+    rows = {
+        recipe_id: row
+        for row, recipe_id in enumerate(matrix.recipe_ids.tolist())
+    }
+    for recipe_id, stored, lowest in SimilarRecipe.objects.values(
+        'recipe_id'
+    ).annotate(
+        stored=Count('id'), lowest=Min('score')
+    ).values_list('recipe_id', 'stored', 'lowest').order_by():
+        if recipe_id in rows and stored >= count:
+            thresholds[rows[recipe_id]] = lowest
+    return thresholds
+
+
+def compute(pool, matrix, recipe_ids, count, thresholds=None):
+    rows = np.searchsorted(matrix.recipe_ids, sorted(recipe_ids))
+    neighbours, stale = {}, set()
+    for batch_neighbours, batch_stale in pool.map(
+        top_neighbours, matrix.batches(rows), repeat(count), repeat(thresholds)
+    ):
+        neighbours.update(batch_neighbours)
+        stale.update(batch_stale)
+    return neighbours, stale
+
+
+def save(neighbours, fingerprints, deleted, full):
+    existing = set(Recipe.objects.values_list('id', flat=True))
+    with transaction.atomic():
+        if full:
+            SimilarRecipe.objects.all().delete()
+            SimilarityState.objects.all().delete()
+        for chunk in chunks([*neighbours, *deleted]):
+            SimilarRecipe.objects.filter(recipe_id__in=chunk).delete()
+            SimilarityState.objects.filter(recipe_id__in=chunk).delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              score=score)
+                for recipe_id, similar in neighbours.items()
+                if recipe_id in existing
+                for similar_id, score in similar
+                if similar_id in existing
+            ),
+            batch_size=1000
+        )
+        SimilarityState.objects.bulk_create(
+            (
+                SimilarityState(
+                    recipe_id=recipe_id,
+                    fingerprint=fingerprints[recipe_id]
+                )
+                for recipe_id in neighbours
+            ),
+            batch_size=1000
+        )
+
+
+class Command(BaseCommand):
+    help = 'Find similar recipes by their ingredients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Number of worker processes.'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every recipe, not only the changed ones.'
+        )
+
+    def handle(self, *args, **options):
+        count = settings.SIMILAR_RECIPES_COUNT
+        full = options['full']
+        matrix = RecipeMatrix.load()
+        fingerprints = matrix.fingerprints()
+        stored = {} if full else dict(
+            SimilarityState.objects.values_list('recipe_id', 'fingerprint')
+        )
+        changed = {
+            recipe_id for recipe_id, fingerprint in fingerprints.items()
+            if stored.get(recipe_id) != fingerprint
+        }
+        deleted = stored.keys() - fingerprints.keys()
+        thresholds = None if full else get_thresholds(matrix, count)
+        stale = set()
+        if not full:
+            for chunk in chunks([*changed, *deleted]):
+                stale.update(SimilarRecipe.objects.filter(
+                    similar_id__in=chunk
+                ).values_list('recipe_id', flat=True))
+        if deleted:
+            stale.update(
+                SimilarRecipe.objects.values('recipe_id').annotate(
+                    stored=Count('id')
+                ).filter(stored__lt=count).values_list(
+                    'recipe_id', flat=True
+                ).order_by()
+            )
+        connections.close_all()
+        neighbours = {}
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=init_worker,
+            initargs=(matrix,)
+        ) as pool:
+            if changed:
+                neighbours, beaten = compute(
+                    pool, matrix, changed, count, thresholds
+                )
+                stale.update(beaten)
+            stale = (stale & fingerprints.keys()) - neighbours.keys()
+            if stale:
+                neighbours.update(compute(pool, matrix, stale, count)[0])
+        save(neighbours, fingerprints, deleted, full)
+        self.stdout.write(
+            f'Changed: {len(changed)}, deleted: {len(deleted)}, '
+            f'recomputed: {len(neighbours)}'
+        )
+        self.stdout.write(self.style.SUCCESS('Similar recipes updated'))
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.core.management.base import BaseCommand
+
+from recipes.models import IngredientRecipe, ShoppingListItem
+from users.models import User
+
+
+def rebuild_shopping_lists(dry_run=False):
+    expected = {
+        (row['recipe__shopping_carts__user'], row['ingredient']):
+            row['total']
+        for row in IngredientRecipe.objects.filter(
+            recipe__shopping_carts__isnull=False
+        ).values(
+            'recipe__shopping_carts__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+    }
+    actual = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        )
+    }
+    drifted = {
+        key for key in expected.keys() | actual.keys()
+        if expected.get(key) != actual.get(key)
+    }
+    users = {user_id for user_id, _ in drifted}
+    if users and not dry_run:
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                pk__in=users
+            ).order_by('pk').values_list('pk', flat=True))
+            ShoppingListItem.objects.filter(user_id__in=users).delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                    if user_id in users
+                ),
+                batch_size=500
+            )
+    return drifted, users
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-user shopping list aggregates from shopping carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted shopping lists.'
+        )
+
+    def handle(self, *args, **options):
+        drifted, users = rebuild_shopping_lists(options['dry_run'])
+        self.stdout.write(
+            f'Drifted rows: {len(drifted)}, users: {len(users)}'
+        )
+        if users and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Shopping lists rebuilt'))
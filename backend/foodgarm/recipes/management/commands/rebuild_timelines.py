@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from recipes.models import TimelineEntry
+from recipes.timeline import backfill_followers
+from users.models import Follow, User
+
+
+def rebuild_timelines():
+    """Убрать записи без подписки и заново разложить рецепты авторов.
+
+    Раскладка идёт в фоновом потоке процесса и теряется при его падении,
+    поэтому команду стоит запускать после сбоев и по расписанию.
+    """
+    stale, _ = TimelineEntry.objects.exclude(
+        Exists(Follow.objects.filter(
+            user=OuterRef('user'),
+            author=OuterRef('author')
+        ))
+    ).delete()
+    author_ids = list(User.objects.filter(
+        following__isnull=False,
+        followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).distinct().values_list('id', flat=True))
+    for author_id in author_ids:
+        backfill_followers(author_id)
+    return stale, author_ids
+
+
+class Command(BaseCommand):
+    help = 'Restore feed timelines from follows and recent recipes.'
+
+    def handle(self, *args, **options):
+        stale, author_ids = rebuild_timelines()
+        self.stdout.write(
+            f'Stale entries removed: {stale}, authors: {len(author_ids)}'
+        )
+        self.stdout.write(self.style.SUCCESS('Timelines rebuilt'))
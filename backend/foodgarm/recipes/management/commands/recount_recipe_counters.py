@@ -0,0 +1,52 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+def actual_count(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def repair_recipe_counters(dry_run=False):
+    drifted = list(Recipe.objects.annotate(
+        actual_favorites=actual_count(Favorite),
+        actual_in_carts=actual_count(ShoppingCart),
+    ).exclude(
+        favorites_count=F('actual_favorites'),
+        in_carts_count=F('actual_in_carts'),
+    ).values_list('pk', flat=True))
+    if drifted and not dry_run:
+        Recipe.objects.filter(pk__in=drifted).update(
+            favorites_count=actual_count(Favorite),
+            in_carts_count=actual_count(ShoppingCart),
+        )
+    return drifted
+
+
+class Command(BaseCommand):
+    help = 'Recompute favorites_count and in_carts_count of recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report recipes with drifted counters.'
+        )
+
+    def handle(self, *args, **options):
+        drifted = repair_recipe_counters(options['dry_run'])
+        self.stdout.write(f'Recipes with drifted counters: {len(drifted)}')
+        if drifted and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Counters repaired'))
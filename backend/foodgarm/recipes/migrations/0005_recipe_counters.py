@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-18 04:07
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipe_relations(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+
+    def actual_count(model_name):
+        model = apps.get_model('recipes', model_name)
+        return Coalesce(
+            Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )
+
+    Recipe.objects.update(
+        favorites_count=actual_count('Favorite'),
+        in_carts_count=actual_count('ShoppingCart'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredientrecipe_unique_ingredient_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(
+            count_recipe_relations, migrations.RunPython.noop
+        ),
+    ]
@@ -1,8 +1,32 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Value,
+    When
+)
+from django.db.models.expressions import RawSQL
 from colorfield.fields import ColorField
 
-from users.models import User
+from users.models import Follow, User
+from .storage import ContentAddressedStorage
+
+TAGS_MASK_BITS = 63
+
+
+def get_tags_mask(tag_ids):
+    """Битовая маска тегов: тег с id N занимает бит N - 1."""
+    mask = 0
+    for tag_id in tag_ids:
+        if 0 < tag_id <= TAGS_MASK_BITS:
+            mask |= 1 << (tag_id - 1)
+    return mask
 
 
 class Ingredient(models.Model):
@@ -50,6 +74,127 @@ class Tag(models.Model):
         return self.name[:50]
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы к рецептам."""
+
+    def with_user_flags(self, user):
+        """Отметки избранного и списка покупок одним запросом."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            ))
+        )
+
+    def with_author_subscription(self, user):
+        """Подписан ли user на автора каждого рецепта."""
+        if user.is_anonymous:
+            return self.annotate(
+                author_is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('author')
+            ))
+        )
+
+    def search(self, query):
+        """Полнотекстовый поиск по названию и описанию.
+
+        Рецепты упорядочены по релевантности. Индекс создаёт миграция
+        0011_recipe_search: tsvector с GIN в Postgres, FTS5 в SQLite.
+        """
+        table = self.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            tsquery = "websearch_to_tsquery('russian', %s)"
+            match = f'{table}.search_vector @@ {tsquery}'
+            rank = f'ts_rank({table}.search_vector, {tsquery})'
+        else:
+            query = ' '.join(
+                '"{}"'.format(word.replace('"', '""'))
+                for word in query.split()
+            )
+            match = (
+                f'{table}.id IN (SELECT rowid FROM {table}_fts'
+                f' WHERE {table}_fts MATCH %s)'
+            )
+            rank = (
+                f'(SELECT -bm25({table}_fts, 10.0, 1.0) FROM {table}_fts'
+                f' WHERE {table}_fts MATCH %s AND rowid = {table}.id)'
+            )
+        return self.filter(
+            RawSQL(match, (query,), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(rank, (query,), output_field=FloatField())
+        ).order_by('-search_rank', '-id')
+
+    def latest_by_author(self, author_ids, limit=None, fields=None):
+        """Последние limit рецептов каждого автора одним запросом.
+
+        Возвращает словарь {id автора: [рецепты]}; без limit - все
+        рецепты авторов. fields - имена загружаемых полей, по умолчанию
+        все поля модели; столбцы, о которых Django не знает, вроде
+        search_vector, не читаются.
+        """
+        recipes = {author_id: [] for author_id in author_ids}
+        if not recipes:
+            return recipes
+        opts = self.model._meta
+        fields = [
+            opts.get_field(name) for name in fields
+        ] if fields else list(opts.concrete_fields)
+        if opts.pk not in fields:
+            fields.append(opts.pk)
+        if opts.get_field('author') not in fields:
+            fields.append(opts.get_field('author'))
+        if limit is None:
+            rows = self.filter(author_id__in=recipes).only(
+                *(field.name for field in fields)
+            ).order_by('-id')
+        else:
+            columns = ', '.join(
+                connection.ops.quote_name(field.column) for field in fields
+            )
+            rows = self.raw(
+                f'SELECT {columns} FROM ('
+                f' SELECT {columns}, ROW_NUMBER() OVER ('
+                '  PARTITION BY author_id ORDER BY id DESC'
+                ' ) AS row_number'
+                f' FROM {opts.db_table}'
+                f' WHERE author_id IN ({", ".join(["%s"] * len(recipes))})'
+                ') AS ranked WHERE row_number <= %s ORDER BY id DESC',
+                [*recipes, limit]
+            )
+        for recipe in rows:
+            recipes[recipe.author_id].append(recipe)
+        return recipes
+
+    def with_related(self, user):
+        """Всё, что нужно для вывода рецептов, за фиксированное число
+        запросов."""
+        return self.with_user_flags(user).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientrecipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            )
+        )
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
@@ -64,7 +209,9 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
         null=True,
+        db_index=True,
         verbose_name='Картинка'
     )
     name = models.CharField(
@@ -87,6 +234,28 @@ class Recipe(models.Model):
         verbose_name='Автор',
         related_name='recipes'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Маска тегов'
+    )
+    image_derivatives = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
@@ -173,3 +342,178 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.recipe} у пользователя {self.user}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Инкрементальное обновление списков покупок."""
+
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавить {ingredient_id: amount} к спискам пользователей.
+
+        Строки пользователей блокируются по возрастанию id: параллельные
+        записи в один список ждут друг друга, а не падают на уникальном
+        ограничении.
+        """
+        user_ids = list(user_ids)
+        deltas = {
+            ingredient_id: amount
+            for ingredient_id, amount in deltas.items() if amount
+        }
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic():
+            self._apply_deltas(user_ids, deltas)
+
+    def _apply_deltas(self, user_ids, deltas):
+        user_ids = list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        items.update(amount=F('amount') + Case(
+            *(When(ingredient_id=ingredient_id, then=Value(amount))
+              for ingredient_id, amount in deltas.items()),
+            default=Value(0)
+        ))
+        self.bulk_create(
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for user_id in user_ids
+            for ingredient_id, amount in deltas.items()
+            if amount > 0 and (user_id, ingredient_id) not in existing
+        )
+        self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+    def add_recipes(self, user_ids, recipe_ids, sign=1):
+        """Добавить рецепты в списки (sign=-1 — убрать)."""
+        deltas = {}
+        for ingredient_id, amount in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'amount'):
+            deltas[ingredient_id] = (
+                deltas.get(ingredient_id, 0) + sign * amount
+            )
+        self.apply_deltas(user_ids, deltas)
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} у пользователя {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='timeline_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт, найденный командой compute_similar_recipes."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='+'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class SimilarityState(models.Model):
+    """Состав рецепта, по которому в последний раз искали похожие.
+
+    Ссылка на рецепт не внешний ключ: запись удалённого рецепта остаётся,
+    чтобы следующий запуск команды заметил удаление.
+    """
+
+    recipe_id = models.PositiveIntegerField(
+        primary_key=True,
+        verbose_name='Рецепт'
+    )
+    fingerprint = models.CharField(
+        max_length=32,
+        verbose_name='Отпечаток ингредиентов'
+    )
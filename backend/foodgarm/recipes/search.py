@@ -0,0 +1,57 @@
+from django.db import connections
+
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    'recipes_recipe_fts_delete': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    'recipes_recipe_fts_update': """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+}
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """Вернуть триггеры FTS5 после миграций в SQLite.
+
+    SQLite пересоздаёт таблицу рецептов почти при любом AlterField и
+    теряет её триггеры. Недостающие триггеры создаются заново, а индекс
+    перестраивается: пока их не было, он мог отстать от таблицы.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master"
+            " WHERE name = 'recipes_recipe_fts' OR name IN (%s, %s, %s)",
+            list(SQLITE_TRIGGERS)
+        )
+        existing = {name for _, name in cursor.fetchall()}
+        if 'recipes_recipe_fts' not in existing:
+            return
+        missing = SQLITE_TRIGGERS.keys() - existing
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute(
+            "INSERT INTO recipes_recipe_fts (recipes_recipe_fts)"
+            " VALUES ('rebuild')"
+        )
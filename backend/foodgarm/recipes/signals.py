@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import Signal, receiver
+
+from users.models import Follow, User
+from .background import submit_on_commit
+from .images import delete_derivatives, release_image, schedule_derivatives
+from .models import (
+    TAGS_MASK_BITS,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    get_tags_mask
+)
+from .timeline import backfill, backfill_followers, fan_out, prune
+
+# Массовые записи в IngredientRecipe не вызывают post_save: после них
+# отправляется этот сигнал с аргументом recipe_ids.
+ingredients_changed = Signal()
+
+
+def update_tags_mask(recipe_ids):
+    """Пересчитать маску тегов у рецептов."""
+    tag_ids = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=tag_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    Recipe.objects.bulk_update(
+        [
+            Recipe(id=recipe_id, tags_mask=get_tags_mask(ids))
+            for recipe_id, ids in tag_ids.items()
+        ],
+        ['tags_mask']
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        update_tags_mask([instance.pk])
+    elif action == 'post_clear':
+        update_tags_mask(instance.__dict__.pop('_cleared_recipe_ids', []))
+    else:
+        update_tags_mask(pk_set)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    if 0 < instance.pk <= TAGS_MASK_BITS:
+        bit = get_tags_mask([instance.pk])
+        Recipe.objects.filter(
+            tags_mask=F('tags_mask').bitor(bit)
+        ).update(tags_mask=F('tags_mask') - bit)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_old_image(sender, instance, raw=False, update_fields=None,
+                       **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is None or 'image' in update_fields:
+        instance._old_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, raw=False, **kwargs):
+    old_image = instance.__dict__.pop('_old_image', None)
+    if old_image and old_image != instance.image.name:
+        transaction.on_commit(lambda: release_image(old_image))
+    if raw or not instance.image:
+        return
+    if instance.image_derivatives.get('source') != instance.image.name:
+        schedule_derivatives(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    image, derivatives = instance.image.name, instance.image_derivatives
+
+    def release():
+        delete_derivatives(derivatives)
+        release_image(image)
+    transaction.on_commit(release)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        submit_on_commit(fan_out, instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    User.objects.filter(pk=instance.author_id).update(
+        followers_count=F('followers_count') + 1
+    )
+    backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    User.objects.filter(
+        pk=instance.author_id,
+        followers_count__gt=0
+    ).update(followers_count=F('followers_count') - 1)
+    prune(instance.user_id, instance.author_id)
+    if User.objects.filter(
+        pk=instance.author_id,
+        followers_count=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        # Автор только что перестал быть крупным.
+        submit_on_commit(backfill_followers, instance.author_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    # pre_delete, а не post_delete: при каскадном удалении рецепта его
+    # ингредиенты могут быть удалены раньше строки корзины.
+    ShoppingListItem.objects.add_recipes(
+        [instance.user_id], [instance.recipe_id], sign=-1
+    )
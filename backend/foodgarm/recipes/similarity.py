@@ -0,0 +1,131 @@
+"""Похожие рецепты по косинусной мере над составом ингредиентов.
+
+Рецепт - разреженный вектор ингредиентов с весом IDF: редкие
+ингредиенты сближают рецепты сильнее, чем соль и вода. Матрица рецептов
+хранится в виде CSR-массивов NumPy, пересечения считаются через обратный
+индекс ингредиент -> рецепты пачками строк.
+"""
+import hashlib
+from itertools import chain
+
+import numpy as np
+
+from .models import IngredientRecipe
+
+BATCH_CELLS = 4_000_000
+
+matrix = None
+
+
+class RecipeMatrix:
+    """Матрица рецепты x ингредиенты в CSR-массивах и обратный индекс."""
+
+    def __init__(self, pairs):
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+        self.ingredient_ids = ingredient_ids
+        self.size = len(self.recipe_ids)
+        self.indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(rows, minlength=self.size)))
+        )
+        self.indices = columns
+        frequency = np.bincount(columns, minlength=len(ingredient_ids))
+        self.weights = np.log((1 + self.size) / (1 + frequency)) + 1
+        self.norms = np.sqrt(np.add.reduceat(
+            self.weights[columns] ** 2, self.indptr[:-1]
+        )) if self.size else np.zeros(0)
+        order = np.argsort(columns, kind='stable')
+        self.postings = rows[order]
+        self.postings_indptr = np.concatenate(([0], np.cumsum(frequency)))
+
+    @classmethod
+    def load(cls):
+        rows = IngredientRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        pairs = np.fromiter(
+            chain.from_iterable(rows.iterator(chunk_size=10000)),
+            dtype=np.int64
+        )
+        return cls(pairs.reshape(-1, 2))
+
+    def fingerprints(self):
+        """Отпечаток состава каждого рецепта по id ингредиентов."""
+        ingredient_ids = self.ingredient_ids[self.indices]
+        return {
+            int(recipe_id): hashlib.md5(
+                ingredient_ids[start:end].tobytes()
+            ).hexdigest()
+            for recipe_id, start, end in zip(
+                self.recipe_ids, self.indptr[:-1], self.indptr[1:]
+            )
+        }
+
+    def similarities(self, rows):
+        """Плотная матрица сходства строк rows со всеми рецептами."""
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        columns = self.indices[np.concatenate(
+            [np.arange(self.indptr[row], self.indptr[row + 1])
+             for row in rows]
+        )]
+        posting_lengths = (
+            self.postings_indptr[columns + 1] - self.postings_indptr[columns]
+        )
+        starts = np.repeat(
+            self.postings_indptr[columns]
+            - np.cumsum(posting_lengths) + posting_lengths,
+            posting_lengths
+        )
+        recipes = self.postings[starts + np.arange(posting_lengths.sum())]
+        batch_rows = np.repeat(
+            np.repeat(np.arange(len(rows)), lengths), posting_lengths
+        )
+        scores = np.bincount(
+            batch_rows * self.size + recipes,
+            weights=np.repeat(self.weights[columns] ** 2, posting_lengths),
+            minlength=len(rows) * self.size
+        ).reshape(len(rows), self.size)
+        scores /= np.outer(self.norms[rows], self.norms)
+        scores[np.arange(len(rows)), rows] = 0
+        return scores
+
+    def batches(self, rows):
+        """Пачки строк, матрица сходства которых помещается в BATCH_CELLS."""
+        batch_size = max(1, BATCH_CELLS // max(self.size, 1))
+        return [
+            rows[start:start + batch_size]
+            for start in range(0, len(rows), batch_size)
+        ]
+
+
+def init_worker(shared_matrix):
+    global matrix
+    matrix = shared_matrix
+
+
+def top_neighbours(rows, count, thresholds=None):
+    """count самых похожих рецептов для каждой строки пачки.
+
+    С thresholds возвращает ещё строки, у которых сходство с каким-либо
+    рецептом пачки выше порога: их списки похожих устарели.
+    """
+    scores = matrix.similarities(rows)
+    count = min(count, matrix.size - 1)
+    top = np.argpartition(-scores, count - 1, axis=1)[:, :count] if (
+        count > 0
+    ) else np.zeros((len(rows), 0), dtype=np.int64)
+    neighbours = {}
+    for index, (row, columns) in enumerate(zip(rows, top)):
+        columns = columns[np.argsort(-scores[index, columns])]
+        row_scores = scores[index, columns]
+        neighbours[int(matrix.recipe_ids[row])] = [
+            (int(matrix.recipe_ids[column]), float(score))
+            for column, score in zip(columns, row_scores) if score > 0
+        ]
+    stale = []
+    if thresholds is not None:
+        stale = matrix.recipe_ids[
+            (scores > thresholds).any(axis=0)
+        ].tolist()
+    return neighbours, stale
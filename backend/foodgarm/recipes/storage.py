@@ -0,0 +1,57 @@
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+def lock_name(name):
+    """Заблокировать имя файла до конца текущей транзакции.
+
+    В Postgres это транзакционная advisory-блокировка по хэшу имени,
+    на других базах блокировки нет.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - хэш его содержимого.
+
+    Одинаковые картинки хранятся в одном файле: если файл с таким хэшем
+    уже есть, повторной записи не происходит. Хэш, посчитанный заранее,
+    можно передать в атрибуте content_hash.
+
+    Имя блокируется до конца транзакции, которая сохраняет рецепт:
+    release_image берёт ту же блокировку и не удалит файл, на который
+    ссылается ещё не закоммиченный рецепт.
+    """
+
+    def get_content_name(self, name, content):
+        digest = getattr(content, 'content_hash', None)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            for chunk in content.chunks():
+                sha256.update(chunk)
+            content.seek(0)
+            digest = sha256.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
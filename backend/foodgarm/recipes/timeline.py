@@ -0,0 +1,113 @@
+from django.conf import settings
+
+from users.models import Follow, User
+from .models import Recipe, TimelineEntry
+
+
+def is_large_author(followers_count):
+    """Рецепты таких авторов не раскладываются по лентам, а читаются
+    при запросе ленты."""
+    return followers_count > settings.FEED_FANOUT_LIMIT
+
+
+def fan_out(recipe_id):
+    """Разложить новый рецепт по лентам подписчиков автора."""
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id
+    ).first()
+    if recipe is None or is_large_author(recipe.author.followers_count):
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id
+            )
+            for user_id in Follow.objects.filter(
+                author_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние рецепты автора после подписки."""
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id
+            )
+            for recipe_id in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-id').values_list(
+                'id', flat=True
+            )[:settings.FEED_BACKFILL_SIZE]
+        ),
+        ignore_conflicts=True
+    )
+
+
+def backfill_followers(author_id):
+    """Добавить последние рецепты автора в ленты всех его подписчиков.
+
+    Нужно, когда автор перестаёт быть крупным: его рецепты больше не
+    читаются при запросе ленты, а опубликованные за это время не были
+    разложены по лентам. Этим же восстанавливаются ленты после сбоя.
+    """
+    recipe_ids = list(Recipe.objects.filter(
+        author_id=author_id
+    ).order_by('-id').values_list(
+        'id', flat=True
+    )[:settings.FEED_BACKFILL_SIZE])
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id
+            )
+            for user_id in Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True).iterator()
+            for recipe_id in recipe_ids
+        ),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты рецепты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_recipe_ids(user, before=None, limit=10):
+    """id рецептов ленты по убыванию, не больше limit, меньше before.
+
+    Записи ленты объединяются с рецептами крупных авторов, которые
+    читаются напрямую.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+    ids = set(
+        entries.order_by('-recipe_id').values_list(
+            'recipe_id', flat=True
+        )[:limit]
+    )
+    large_authors = User.objects.filter(
+        following__user=user,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values('id')
+    recipes = Recipe.objects.filter(author__in=large_authors)
+    if before is not None:
+        recipes = recipes.filter(id__lt=before)
+    ids.update(
+        recipes.order_by('-id').values_list('id', flat=True)[:limit]
+    )
+    return sorted(ids, reverse=True)[:limit]
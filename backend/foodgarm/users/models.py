@@ -1,9 +1,35 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import BooleanField, Count, Exists, OuterRef, Value
 
 from .validators import validate_username
 
 
+class UserQuerySet(models.QuerySet):
+    """Запросы к пользователям."""
+
+    def with_is_subscribed(self, user):
+        """Подписан ли user на каждого пользователя из выборки."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user,
+                author=OuterRef('pk')
+            ))
+        )
+
+    def with_recipes_count(self):
+        """Число рецептов каждого пользователя."""
+        return self.annotate(recipes_count=Count('recipes'))
+
+
+class FoodgramUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     USER = 'user'
     ADMIN = 'admin'
@@ -52,6 +78,13 @@ class User(AbstractUser):
         choices=USER_ROLES,
         default=USER
     )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
+
+    objects = FoodgramUserManager()
 
     @property
     def is_admin(self):